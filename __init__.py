@@ -3,20 +3,37 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from collections.abc import Callable
+from typing import Any
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.exceptions import ConfigEntryNotReady
+from homeassistant.helpers import (
+    config_validation as cv,
+    device_registry as dr,
+    entity_registry as er,
+)
 from homeassistant.helpers.device_registry import DeviceEntry
-
-from .const import DOMAIN
-from .coordinator import PortainerDataCoordinator
+from homeassistant.helpers.typing import ConfigType
+
+from .api import CannotConnect, InvalidAuth, SSLCertificateError
+from .const import CONF_INSTANCE_ID, DOMAIN
+from .coordinator import (
+    PortainerDataCoordinator,
+    async_get_hub,
+    async_release_hub,
+    snapshot_store,
+)
+from .services import async_setup_services
+from .stats import ContainerStatsCoordinator
 
 # TODO List the platforms that you want to support.
 # For your initial PR, limit it to 1 platform.
 PLATFORMS: list[Platform] = [Platform.SENSOR, Platform.SWITCH]
 
+CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
+
 type PortainerConfigEntry = ConfigEntry[RuntimeData]  # noqa: F821
 
 
@@ -26,6 +43,14 @@ class RuntimeData:
 
     coordinator: PortainerDataCoordinator
     cancel_update_listener: Callable
+    stats: ContainerStatsCoordinator
+
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    """Set up the Portainer services."""
+    async_setup_services(hass)
+
+    return True
 
 
 async def async_setup_entry(
@@ -39,24 +64,113 @@ async def async_setup_entry(
 
     hass.data.setdefault(DOMAIN, {})
 
-    coordinator = PortainerDataCoordinator(hass, config_entry)
-
-    await coordinator.async_config_entry_first_refresh()
-
-    if not coordinator.data:
-        raise ConfigEntryNotReady
+    # Entries configured against the same Portainer instance share a hub so
+    # that each poll is a single request regardless of the number of entries.
+    hub = async_get_hub(hass, config_entry)
+    coordinator = PortainerDataCoordinator(hass, config_entry, hub)
+
+    try:
+        try:
+            await coordinator.async_load_environments()
+        except (CannotConnect, InvalidAuth, SSLCertificateError) as err:
+            raise ConfigEntryNotReady("Failed to list Portainer environments") from err
+
+        coordinator.attach()
+
+        # Endpoints saved by the previous run, or already fetched for another
+        # entry, let the entities be created right away. The refresh then
+        # happens in the background and reconciles them.
+        if await coordinator.async_restore():
+            config_entry.async_create_background_task(
+                hass, hub.async_request_refresh(), f"{DOMAIN} first refresh"
+            )
+        else:
+            await coordinator.async_config_entry_first_refresh()
+
+        if not coordinator.data:
+            raise ConfigEntryNotReady
+    except Exception:
+        await async_release_hub(hass, coordinator)
+        raise
 
     cancel_update_listener = config_entry.async_on_unload(
         config_entry.add_update_listener(_async_update_listener)
     )
 
-    config_entry.runtime_data = RuntimeData(coordinator, cancel_update_listener)
+    # Stacks Portainer manages get entities even while they are down, they
+    # are restored with the endpoints or show up once listed.
+    if not coordinator.summary_only:
+        config_entry.async_create_background_task(
+            hass, hub.async_refresh_stacks(), f"{DOMAIN} stacks"
+        )
+
+    await _async_migrate_container_ids(hass, config_entry, coordinator)
+    coordinator.async_track_registered_devices()
+
+    config_entry.runtime_data = RuntimeData(
+        coordinator,
+        cancel_update_listener,
+        ContainerStatsCoordinator(hass, config_entry, coordinator),
+    )
 
     await hass.config_entries.async_forward_entry_setups(config_entry, PLATFORMS)
 
     return True
 
 
+async def _async_migrate_container_ids(
+    hass: HomeAssistant,
+    config_entry: PortainerConfigEntry,
+    coordinator: PortainerDataCoordinator,
+) -> None:
+    """Move devices and entities keyed by container id onto container keys.
+
+    Only containers which still exist can be mapped, devices of the others are
+    left for the user to delete.
+    """
+    device_registry = dr.async_get(hass)
+    entity_registry = er.async_get(hass)
+
+    def _new_id(container_id: str) -> str | None:
+        if (container := coordinator.get_container(container_id)) is None:
+            return None
+
+        return coordinator.container_unique_id(coordinator.container_key(container))
+
+    for device in dr.async_entries_for_config_entry(
+        device_registry, config_entry.entry_id
+    ):
+        for domain, identifier in device.identifiers:
+            if domain != DOMAIN or (new_id := _new_id(identifier)) is None:
+                continue
+
+            if device_registry.async_get_device(identifiers={(DOMAIN, new_id)}):
+                continue
+
+            device_registry.async_update_device(
+                device.id,
+                new_identifiers=device.identifiers - {(domain, identifier)}
+                | {(DOMAIN, new_id)},
+            )
+
+    @callback
+    def _migrate(entity_entry: er.RegistryEntry) -> dict[str, Any] | None:
+        _, _, rest = entity_entry.unique_id.partition("-")
+        container_id, _, suffix = rest.partition("-")
+
+        if (new_id := _new_id(container_id)) is None:
+            return None
+
+        unique_id = f"{DOMAIN}-{new_id}-{suffix}"
+
+        if entity_registry.async_get_entity_id(entity_entry.domain, DOMAIN, unique_id):
+            return None
+
+        return {"new_unique_id": unique_id}
+
+    await er.async_migrate_entries(hass, config_entry.entry_id, _migrate)
+
+
 async def _async_update_listener(hass: HomeAssistant, config_entry: ConfigEntry):
     """Handle config options update.
 
@@ -82,4 +196,19 @@ async def async_unload_entry(hass: HomeAssistant, entry: PortainerConfigEntry) -
     """Unload a config entry."""
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
 
+    if unload_ok:
+        await async_release_hub(hass, entry.runtime_data.coordinator)
+
     return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: PortainerConfigEntry) -> None:
+    """Delete the saved endpoints once no entry uses the instance anymore."""
+    instance_id = entry.data[CONF_INSTANCE_ID]
+
+    if not any(
+        other.data.get(CONF_INSTANCE_ID) == instance_id
+        for other in hass.config_entries.async_entries(DOMAIN)
+        if other.entry_id != entry.entry_id
+    ):
+        await snapshot_store(hass, instance_id).async_remove()
@@ -1,3 +1,6 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from copy import copy
 from dataclasses import dataclass
 from ssl import SSLCertVerificationError
 from typing import Any
@@ -5,12 +8,62 @@ import aiohttp
 import asyncio
 import logging
 import json
+import sys
+import time
 
 from homeassistant.helpers.entity_platform import HomeAssistantError
+from homeassistant.util.json import json_loads
+from homeassistant.util.ssl import get_default_context, get_default_no_verify_context
 from enum import Enum
 
+from .decode import ContainerFilter, MalformedBody, compact_endpoint
+from .metrics import PortainerMetrics
+from .resilience import GET_RETRIES, CircuitBreaker, SingleFlight, retry_delay
+
 _LOGGER = logging.getLogger(__name__)
 
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=10)
+# Event streams can legitimately be idle for a long time, so only the
+# connection attempt is bounded.
+EVENTS_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=10)
+# Stats are best effort, a slow daemon should not hold up a sampling round.
+STATS_TIMEOUT = aiohttp.ClientTimeout(total=5)
+
+# Portainer's stack types and statuses
+STACK_TYPE_COMPOSE = 2
+STACK_STATUS_ACTIVE = 1
+
+
+def _create_session(verify_ssl: bool) -> aiohttp.ClientSession:
+    """Create a pooled keep-alive session, for use outside of Home Assistant."""
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            ssl=(
+                get_default_context() if verify_ssl else get_default_no_verify_context()
+            ),
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+        )
+    )
+
+
+def _is_docker_proxy(path: str) -> bool:
+    return path.startswith("/api/endpoints/") and "/docker/" in path
+
+
+def _status_error(status: int) -> HomeAssistantError:
+    """Map an unexpected response status to the matching exception."""
+    if status in (401, 403):
+        return InvalidAuth()
+    if status == 404:
+        # Portainer answers 404 for environments and containers that do not
+        # exist, bad credentials get a 401.
+        return NotFound()
+    if status >= 500:
+        return TemporaryFailure()
+
+    return CannotConnect()
+
 
 @dataclass
 class PortainerSystemStatus:
@@ -28,15 +81,42 @@ class ContainerState(Enum):
     REMOVING = "removing"
 
 
+def endpoint_containers(endpoint: dict[str, Any]) -> list["PortainerContainer"]:
+    """Return the container list of a compact endpoint."""
+    return endpoint["Containers"]
+
+
+def endpoint_list(endpoints: list[dict[str, Any]]) -> list["Endpoint"]:
+    """Return the Endpoint descriptions of compact endpoints."""
+    return [Endpoint(e["Id"], e["URL"], e["Name"]) for e in endpoints]
+
+
 class PortainerContainer:
+    """A compact record of the container fields the integration uses.
+
+    Only the fields below are copied out of the docker container dict, so the
+    dict itself can be freed. Strings which repeat across containers (names,
+    images and labels) are interned.
+    """
+
+    __slots__ = ("_id", "_names", "_state", "_status", "_image", "_created", "_labels")
+
     def __init__(self, data: dict[str, Any]) -> None:
-        self.snapshot_data = data
+        self._id: str = data["Id"]
+        self._names: tuple[str, ...] = tuple(sys.intern(n) for n in data["Names"])
+        self._state = ContainerState(data["State"])
+        self._status: str = data.get("Status", "")
+        self._image: str = sys.intern(data["Image"])
+        self._created: int = data["Created"]
+        self._labels: dict[str, str] = {
+            sys.intern(k): sys.intern(v) for k, v in (data.get("Labels") or {}).items()
+        }
 
     def id(self) -> str:
-        return self.snapshot_data["Id"]
+        return self._id
 
-    def names(self) -> list[str]:
-        return self.snapshot_data["Names"]
+    def names(self) -> tuple[str, ...]:
+        return self._names
 
     def name(self, i=0) -> str | None:
         names = self.names()
@@ -54,14 +134,93 @@ class PortainerContainer:
 
         return n.removeprefix("/")
 
+    def key(self) -> str:
+        """The container's name, which unlike its id survives recreation."""
+        return self.stripped_name() or self._id
+
     def state(self) -> ContainerState:
-        return ContainerState(self.snapshot_data["State"])
+        return self._state
+
+    def labels(self) -> dict[str, str]:
+        return self._labels
+
+    def status(self) -> str:
+        return self._status
+
+    def fingerprint(self) -> tuple[tuple, str]:
+        """The fields that entities render, used to detect changed containers.
+
+        Docker's status text is relative ("Up 5 minutes") and changes by
+        itself as time passes, so it is kept apart from the other fields.
+        """
+        return (self._id, self._state, self._image, self._names), self._status
 
     def created(self) -> int:
-        return self.snapshot_data["Created"]
+        return self._created
+
+    def image(self) -> str:
+        return self._image
+
+    def as_dict(self) -> dict[str, Any]:
+        """The docker fields the record was built from, e.g. to persist it."""
+        return {
+            "Id": self._id,
+            "Names": list(self._names),
+            "State": self._state.value,
+            "Status": self._status,
+            "Image": self._image,
+            "Created": self._created,
+            "Labels": self._labels,
+        }
+
+    def with_state(self, state: ContainerState, status: str) -> "PortainerContainer":
+        """Return a copy of the container in another state."""
+        container = copy(self)
+        container._state = state
+        container._status = status
+
+        return container
+
+
+class PortainerStack:
+    """A Portainer stack, of which only compose stacks are kept."""
+
+    __slots__ = ("id", "name", "endpoint_id", "active")
 
-    def image(self) -> int:
-        return self.snapshot_data["Image"]
+    def __init__(self, data: dict[str, Any]) -> None:
+        self.id: int = data["Id"]
+        self.name: str = data["Name"]
+        self.endpoint_id: int = data["EndpointId"]
+        self.active: bool = data.get("Status") == STACK_STATUS_ACTIVE
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, PortainerStack):
+            return NotImplemented
+
+        return (self.id, self.name, self.endpoint_id, self.active) == (
+            other.id,
+            other.name,
+            other.endpoint_id,
+            other.active,
+        )
+
+    def __repr__(self) -> str:
+        return f'PortainerStack ({self.id}, "{self.name}", e{self.endpoint_id})'
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "Id": self.id,
+            "Name": self.name,
+            "EndpointId": self.endpoint_id,
+            "Type": STACK_TYPE_COMPOSE,
+            "Status": STACK_STATUS_ACTIVE if self.active else 0,
+        }
+
+    def with_active(self, active: bool) -> "PortainerStack":
+        stack = copy(self)
+        stack.active = active
+
+        return stack
 
 
 class PortainerAPI:
@@ -73,14 +232,30 @@ class PortainerAPI:
         ssl: bool,
         verify_ssl: bool,
         environment: int,
+        session: aiohttp.ClientSession | None = None,
     ) -> None:
+        """Create the API client.
+
+        A session, if given, must verify certificates according to verify_ssl,
+        e.g. Home Assistant's async_get_clientsession(hass, verify_ssl). It is
+        shared and not closed by close(). Otherwise the client creates and
+        owns a session of its own.
+        """
         self._host = host
         self._api_key = api_key
         self._ssl = ssl
         self._verify_ssl = verify_ssl
         self._environment = environment
         self._port = port
-        self._session = aiohttp.ClientSession()
+        self._owns_session = session is None
+        self._session = session or _create_session(verify_ssl)
+        self.metrics = PortainerMetrics()
+        self.circuit = CircuitBreaker()
+        self._probe_lock = asyncio.Lock()
+        self._gets = SingleFlight(self.metrics.record_coalesced_request)
+        # Actions which completed, a GET is only shared by callers asking
+        # before the same number of them.
+        self.actions = 0
 
     async def __aenter__(self) -> "PortainerAPI":
         return self
@@ -89,134 +264,463 @@ class PortainerAPI:
         await self.close()
 
     async def close(self):
-        await self._session.close()
+        if self._owns_session:
+            await self._session.close()
+
         self._session = None
 
+    def connects_to(
+        self, host: str, port: str, api_key: str, ssl: bool, verify_ssl: bool
+    ) -> bool:
+        """Whether the client talks to this server with these credentials."""
+        return (host, str(port), api_key, ssl, verify_ssl) == (
+            self._host,
+            str(self._port),
+            self._api_key,
+            self._ssl,
+            self._verify_ssl,
+        )
+
     def _url(self):
         if self._ssl:
             return "https://" + self._host
 
         return "http://" + self._host
 
-    async def _make_get_request(self, path: str, auth=True):
+    async def _check_circuit(self) -> None:
+        """Fail fast while the circuit is open.
+
+        Once the reset timeout has passed the cheap, unauthenticated system
+        status is probed before letting requests through again. Any failed
+        probe reopens the circuit, errors other than temporary failures are
+        raised as they are.
+        """
+        if self.circuit.state == CircuitBreaker.CLOSED:
+            return
+
+        async with self._probe_lock:
+            state = self.circuit.state
+
+            if state == CircuitBreaker.CLOSED:
+                return
+            elif state == CircuitBreaker.OPEN:
+                raise CircuitOpen
+
+            _LOGGER.debug("Probing Portainer after %d failures", self.circuit.failures)
+
+            try:
+                await self._get_once("/api/system/status", auth=False)
+            except TemporaryFailure as e:
+                self.circuit.record_failure()
+                raise CircuitOpen from e
+            except (CannotConnect, InvalidAuth, SSLCertificateError):
+                self.circuit.record_failure()
+                raise
+
+            _LOGGER.info("Portainer at %s is reachable again", self._host)
+            self.circuit.record_success()
+
+    def _record_failure(self) -> None:
+        opened = self.circuit.state != CircuitBreaker.CLOSED
+        self.circuit.record_failure()
+
+        if not opened and self.circuit.state != CircuitBreaker.CLOSED:
+            _LOGGER.warning(
+                "Suspending requests to %s after %d failures",
+                self._host,
+                self.circuit.failures,
+            )
+
+    async def _make_get_request(self, path: str, auth=True, params=None):
+        """GET a path and return its decoded JSON body.
+
+        Concurrent identical GETs share one request and its result, which
+        callers must not modify. Callers never share a GET that started before
+        an action they may have made completed.
+        """
+        key = (path, auth, repr(params), self.actions)
+
+        return await self._gets.run(
+            key, lambda: self._get_with_retries(path, auth, params)
+        )
+
+    async def _get_with_retries(self, path: str, auth, params):
+        """GET a path, retrying temporary failures.
+
+        GETs are idempotent, so temporary failures are retried with jittered
+        exponential backoff. Repeated failures, and certificate errors, which
+        retrying cannot fix, open the circuit.
+        """
+        await self._check_circuit()
+
+        for attempt in range(GET_RETRIES + 1):
+            try:
+                res = await self._get_once(path, auth, params)
+            except SSLCertificateError:
+                self._record_failure()
+                raise
+            except TemporaryFailure:
+                if attempt == GET_RETRIES:
+                    # Docker proxy failures say more about the environment
+                    # than about Portainer, an offline environment must not
+                    # suspend requests to the others.
+                    if not _is_docker_proxy(path):
+                        self._record_failure()
+
+                    raise
+
+                delay = retry_delay(attempt)
+                _LOGGER.debug("Retrying %s in %.2fs", path, delay)
+                await asyncio.sleep(delay)
+            else:
+                self.circuit.record_success()
+                return res
+
+    async def _get_once(self, path: str, auth=True, params=None, timeout=None):
         headers = {}
 
         if auth:
             headers = {"X-API-Key": self._api_key}
 
+        start = time.perf_counter()
+
         try:
             async with self._session.get(
                 f"{self._url()}:{self._port}{path}",
                 headers=headers,
-                ssl=self._verify_ssl,
-                timeout=aiohttp.ClientTimeout(total=10),
+                params=params,
+                timeout=timeout or REQUEST_TIMEOUT,
             ) as response:
                 if response.status == 200:
-                    res = await response.json()
-                    _LOGGER.debug(json.dumps(res))
+                    body = await response.read()
+                    latency = time.perf_counter() - start
+
+                    parse_start = time.perf_counter()
+                    try:
+                        res = json_loads(body)
+                    except ValueError as e:
+                        raise MalformedBody(str(e)) from e
+                    parse_time = time.perf_counter() - parse_start
+
+                    self.metrics.record_request(path, latency, len(body), parse_time)
+
+                    _LOGGER.debug(
+                        "Received %d bytes from %s in %.1f ms (parsed in %.2f ms)",
+                        len(body),
+                        path,
+                        latency * 1000,
+                        parse_time * 1000,
+                    )
                     return res
-                elif response.status == 404:
-                    raise InvalidAuth
                 else:
-                    _LOGGER.error(
-                        f'Request to "{self._url()}:{self._port}{path}" encountered a connection error.'
+                    self.metrics.record_error(path)
+                    _LOGGER.debug(
+                        'Request to "%s:%s%s" failed with status %d',
+                        self._url(),
+                        self._port,
+                        path,
+                        response.status,
                     )
-                    raise CannotConnect
+                    raise _status_error(response.status)
         except SSLCertVerificationError as e:
-            _LOGGER.error(
-                'Request to "%s:%d%s" encountered a certificate error',
+            self.metrics.record_error(path)
+            _LOGGER.debug(
+                'Request to "%s:%s%s" encountered a certificate error',
                 self._url(),
                 self._port,
                 path,
             )
 
-            raise SSLCertificateError
-        except aiohttp.ClientConnectionError as e:
-            _LOGGER.error(
-                f'Request to "{self._url()}:{self._port}{path}" encountered a connection error.'
+            raise SSLCertificateError from e
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError) as e:
+            self.metrics.record_error(path)
+            _LOGGER.debug(
+                'Request to "%s:%s%s" encountered a connection error: %s',
+                self._url(),
+                self._port,
+                path,
+                e,
             )
 
-            raise CannotConnect
+            raise TemporaryFailure from e
+        except MalformedBody as e:
+            # Usually a body cut short by a proxy or a restarting server.
+            self.metrics.record_error(path)
+            _LOGGER.debug(
+                'Request to "%s:%s%s" returned a malformed body: %s',
+                self._url(),
+                self._port,
+                path,
+                e,
+            )
+
+            raise TemporaryFailure from e
         except asyncio.TimeoutError as e:
-            _LOGGER.error(
+            self.metrics.record_error(path)
+            _LOGGER.debug(
                 'Request to "%s:%s%s" timed out', self._url(), self._port, path
             )
 
-            _LOGGER.debug("Error details: ")
-            raise CannotConnect
+            raise TemporaryFailure from e
 
     async def _make_post_request_no_body(
-        self, path: str, auth=True
+        self, path: str, auth=True, params=None
     ) -> dict[str, any] | None:
+        # Actions are not idempotent and never retried, but they do not hammer
+        # a server which is known to be down either.
+        await self._check_circuit()
+
         headers = {}
 
         if auth:
             headers = {"X-API-Key": self._api_key}
 
+        start = time.perf_counter()
+
         try:
             async with self._session.post(
                 f"{self._url()}:{self._port}{path}",
                 headers=headers,
-                ssl=self._verify_ssl,
-                timeout=aiohttp.ClientTimeout(total=10),
+                params=params,
+                timeout=REQUEST_TIMEOUT,
             ) as response:
                 if response.status == 200:
-                    r = await response.json()
-                    _LOGGER.debug(json.dumps(r))
-                    return r
+                    body = await response.read()
+                    latency = time.perf_counter() - start
+
+                    parse_start = time.perf_counter()
+                    try:
+                        res = json_loads(body)
+                    except ValueError as e:
+                        raise MalformedBody(str(e)) from e
+                    parse_time = time.perf_counter() - parse_start
+
+                    self.metrics.record_request(path, latency, len(body), parse_time)
+                    return res
                 elif response.status == 204 or response.status == 304:
+                    self.metrics.record_request(path, time.perf_counter() - start, 0)
                     return None
-                elif response.status == 404:
-                    raise InvalidAuth
                 else:
+                    self.metrics.record_error(path)
                     _LOGGER.error(
-                        f'Request to "{self._url()}:{self._port}{path}" encountered a connection error.'
+                        'Request to "%s:%s%s" failed with status %d',
+                        self._url(),
+                        self._port,
+                        path,
+                        response.status,
                     )
-                    raise CannotConnect
+                    raise _status_error(response.status)
         except SSLCertVerificationError as e:
+            self.metrics.record_error(path)
             _LOGGER.error(
-                'Request to "%s:%d%s" encountered a certificate error',
+                'Request to "%s:%s%s" encountered a certificate error',
                 self._url(),
                 self._port,
                 path,
             )
 
             raise SSLCertificateError from e
-        except aiohttp.ClientConnectionError as e:
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError) as e:
+            self.metrics.record_error(path)
+            _LOGGER.error(
+                'Request to "%s:%s%s" encountered a connection error: %s',
+                self._url(),
+                self._port,
+                path,
+                e,
+            )
+
+            raise CannotConnect from e
+        except MalformedBody as e:
+            # The action was made, only its answer was cut short or garbled.
+            self.metrics.record_error(path)
             _LOGGER.error(
-                f'Request to "{self._url()}:{self._port}{path}" encountered a connection error.'
+                'Request to "%s:%s%s" returned a malformed body: %s',
+                self._url(),
+                self._port,
+                path,
+                e,
             )
 
             raise CannotConnect from e
         except asyncio.TimeoutError as e:
+            self.metrics.record_error(path)
             _LOGGER.error(
                 'Request to "%s:%s%s" timed out', self._url(), self._port, path
             )
 
-            _LOGGER.debug("Error details: ")
             raise CannotConnect from e
+        finally:
+            # Even a failed action may have changed something.
+            self.actions += 1
+
+    async def load_endpoint_snapshots(
+        self,
+        endpoint_ids: list[int] | None = None,
+        accept: ContainerFilter | None = None,
+    ) -> list[dict[str, any]]:
+        """Load endpoints reduced to the compact form described in decode.py.
 
-    async def load_endpoints(self) -> list[dict[str, any]]:
-        _LOGGER.debug("Loading Endpoints")
+        Without endpoint ids every endpoint is loaded. Containers rejected by
+        accept are skipped before a PortainerContainer is built for them.
+        """
+        _LOGGER.debug("Loading Endpoint Snapshots %s", endpoint_ids or "(all)")
 
-        return await self._make_get_request("/api/endpoints")
+        array = endpoint_ids is None or len(endpoint_ids) > 1
+        path = "/api/endpoints" if array else f"/api/endpoints/{endpoint_ids[0]}"
+        params = None
 
-    async def load_endpoints_list(self) -> list[int]:
+        if array and endpoint_ids:
+            # Portainer reads array query parameters with a [] suffix and
+            # ignores the plain name, which would list every endpoint.
+            params = [("endpointIds[]", i) for i in endpoint_ids]
+
+        res = await self._make_get_request(path, params=params)
+
+        return [
+            compact_endpoint(e, PortainerContainer, accept)
+            for e in (res if array else [res])
+        ]
+
+    async def load_endpoints_list(self) -> list["Endpoint"]:
         _LOGGER.debug("Loading Endpoints List")
 
-        endpoints = await self.load_endpoints()
+        # Listings embed every snapshot, only the compact form is kept.
+        endpoints = await self.load_endpoint_snapshots()
+
+        return endpoint_list(endpoints)
 
-        return [Endpoint(e["Id"], e["URL"], e["Name"]) for e in endpoints]
+    async def load_stacks(self) -> list[PortainerStack]:
+        """List the compose stacks Portainer manages, across all endpoints."""
+        _LOGGER.debug("Loading Stacks")
+
+        res = await self._make_get_request("/api/stacks")
+
+        return [PortainerStack(s) for s in res if s.get("Type") == STACK_TYPE_COMPOSE]
 
     async def system_status(self) -> PortainerSystemStatus:
         _LOGGER.debug("Fetching System Status")
 
         res = await self._make_get_request("/api/system/status", auth=False)
 
-        _LOGGER.debug(json.dumps(res, indent=4))
-
         return PortainerSystemStatus(res["Version"], res["InstanceID"])
 
+    async def list_containers(
+        self,
+        endpoint_id: int,
+        filters: dict[str, list[str]] | None = None,
+        accept: ContainerFilter | None = None,
+    ) -> list["PortainerContainer"]:
+        """List an endpoint's containers live through the docker proxy.
+
+        Filters use the docker API format and are applied by the docker
+        daemon, e.g. {"label": ["com.docker.compose.project=web"]}. What they
+        cannot express is left to accept.
+        """
+        _LOGGER.debug("Listing containers of endpoint %s", endpoint_id)
+
+        params = {"all": "1"}
+
+        if filters:
+            params["filters"] = json.dumps(filters)
+
+        res = await self._make_get_request(
+            f"/api/endpoints/{endpoint_id}/docker/containers/json", params=params
+        )
+
+        return [
+            PortainerContainer(c)
+            for c in res
+            if accept is None or accept(endpoint_id, c)
+        ]
+
+    @asynccontextmanager
+    async def event_stream(
+        self, endpoint_id: int, filters: dict[str, list[str]] | None = None
+    ) -> AsyncIterator[AsyncIterator[dict[str, Any]]]:
+        """Open the Docker events stream of an endpoint.
+
+        Yields an async iterator of decoded events which ends when the server
+        closes the stream. The request has no read timeout as the stream can
+        legitimately be idle for a long time.
+        """
+        path = f"/api/endpoints/{endpoint_id}/docker/events"
+        params = None
+
+        if filters:
+            params = {"filters": json.dumps(filters)}
+
+        try:
+            async with self._session.get(
+                f"{self._url()}:{self._port}{path}",
+                headers={"X-API-Key": self._api_key},
+                params=params,
+                timeout=EVENTS_TIMEOUT,
+            ) as response:
+                if response.status != 200:
+                    _LOGGER.error(
+                        'Request to "%s:%s%s" failed with status %d',
+                        self._url(),
+                        self._port,
+                        path,
+                        response.status,
+                    )
+                    raise _status_error(response.status)
+
+                _LOGGER.debug(
+                    "Connected to the event stream of endpoint %s", endpoint_id
+                )
+
+                yield self._decode_events(response.content)
+        except SSLCertVerificationError as e:
+            raise SSLCertificateError from e
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise CannotConnect from e
+
+    async def _decode_events(
+        self, content: aiohttp.StreamReader
+    ) -> AsyncIterator[dict[str, Any]]:
+        # Docker writes one JSON document per line, the reader buffers any
+        # partial line until the rest of it arrives.
+        try:
+            async for line in content:
+                line = line.strip()
+
+                if not line:
+                    continue
+
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    _LOGGER.warning("Discarding malformed docker event: %s", line[:200])
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise CannotConnect from e
+
+    async def inspect_container(
+        self, endpoint_id: int, container_id: str
+    ) -> dict[str, Any]:
+        return await self._make_get_request(
+            f"/api/endpoints/{endpoint_id}/docker/containers/{container_id}/json"
+        )
+
+    async def container_stats(
+        self, endpoint_id: int, container_id: str
+    ) -> dict[str, Any]:
+        """Take a single stats sample of a running container.
+
+        The sample is one-shot, so its precpu_stats are empty and CPU usage
+        has to be computed from consecutive samples. Stats are best effort:
+        they are not retried and do not count towards the circuit breaker.
+        """
+        if self.circuit.state != CircuitBreaker.CLOSED:
+            raise CircuitOpen
+
+        return await self._get_once(
+            f"/api/endpoints/{endpoint_id}/docker/containers/{container_id}/stats",
+            params={"stream": "false", "one-shot": "true"},
+            timeout=STATS_TIMEOUT,
+        )
+
     async def start_container(self, endpoint_id: str, container_id: str):
         _LOGGER.debug("Issuing start request")
 
@@ -231,6 +735,53 @@ class PortainerAPI:
             f"/api/endpoints/{endpoint_id}/docker/containers/{container_id}/stop"
         )
 
+    async def restart_container(self, endpoint_id: str, container_id: str):
+        _LOGGER.debug("Issuing restart request")
+
+        await self._make_post_request_no_body(
+            f"/api/endpoints/{endpoint_id}/docker/containers/{container_id}/restart"
+        )
+
+    async def pause_container(self, endpoint_id: str, container_id: str):
+        _LOGGER.debug("Issuing pause request")
+
+        await self._make_post_request_no_body(
+            f"/api/endpoints/{endpoint_id}/docker/containers/{container_id}/pause"
+        )
+
+    async def unpause_container(self, endpoint_id: str, container_id: str):
+        _LOGGER.debug("Issuing unpause request")
+
+        await self._make_post_request_no_body(
+            f"/api/endpoints/{endpoint_id}/docker/containers/{container_id}/unpause"
+        )
+
+    async def start_stack(
+        self, stack_id: int, endpoint_id: int
+    ) -> PortainerStack | None:
+        """Start every service of a stack with a single request.
+
+        Returns the stack as updated by Portainer, if it sent it back.
+        """
+        _LOGGER.debug("Issuing stack start request")
+
+        res = await self._make_post_request_no_body(
+            f"/api/stacks/{stack_id}/start", params={"endpointId": endpoint_id}
+        )
+
+        return PortainerStack(res) if res else None
+
+    async def stop_stack(
+        self, stack_id: int, endpoint_id: int
+    ) -> PortainerStack | None:
+        _LOGGER.debug("Issuing stack stop request")
+
+        res = await self._make_post_request_no_body(
+            f"/api/stacks/{stack_id}/stop", params={"endpointId": endpoint_id}
+        )
+
+        return PortainerStack(res) if res else None
+
 
 class Endpoint:
     def __init__(self, id: int, url: str, name: str):
@@ -255,3 +806,15 @@ class CannotConnect(HomeAssistantError):
 
 class InvalidAuth(HomeAssistantError):
     """Error to indicate there is invalid auth."""
+
+
+class TemporaryFailure(CannotConnect):
+    """Error to indicate a request failed in a way that may pass when retried."""
+
+
+class CircuitOpen(CannotConnect):
+    """Error to indicate requests are suspended after repeated failures."""
+
+
+class NotFound(CannotConnect):
+    """Error to indicate an environment or container does not exist."""
@@ -4,13 +4,84 @@ from .api import PortainerContainer, ContainerState
 from homeassistant.core import callback
 from homeassistant.helpers.device_registry import DeviceInfo
 from .const import DOMAIN
+from .stacks import StackKey
 
+from collections.abc import Callable, Iterable
 from typing import Any
 import logging
 
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
 _LOGGER = logging.getLogger(__name__)
 
 
+@callback
+def async_add_container_entities(
+    entry: ConfigEntry,
+    coordinator: PortainerDataCoordinator,
+    async_add_entities: AddEntitiesCallback,
+    factory: Callable[[PortainerContainer], Iterable[Entity]],
+) -> None:
+    """Add the entities of every container, including ones created later.
+
+    Containers are reconciled after each refresh. Entities of containers that
+    disappeared are removed together with their device by the coordinator,
+    after which the container is forgotten here and gets new entities if it
+    ever comes back.
+    """
+    known: set[str] = set()
+
+    @callback
+    def _async_add_new_containers() -> None:
+        known.intersection_update(coordinator.container_keys())
+
+        new = [
+            c
+            for c in coordinator.get_containers()
+            if coordinator.container_key(c) not in known
+        ]
+
+        if not new:
+            return
+
+        known.update(coordinator.container_key(c) for c in new)
+        async_add_entities(entity for c in new for entity in factory(c))
+
+    _async_add_new_containers()
+    entry.async_on_unload(coordinator.async_add_listener(_async_add_new_containers))
+
+
+@callback
+def async_add_stack_entities(
+    entry: ConfigEntry,
+    coordinator: PortainerDataCoordinator,
+    async_add_entities: AddEntitiesCallback,
+    factory: Callable[[StackKey], Iterable[Entity]],
+) -> None:
+    """Add the entities of every stack, including ones which show up later.
+
+    The coordinator removes the device of a stack once it is gone, like it
+    does for containers.
+    """
+    known: set[StackKey] = set()
+
+    @callback
+    def _async_add_new_stacks() -> None:
+        known.intersection_update(coordinator.stack_keys())
+        new = coordinator.stack_keys() - known
+
+        if not new:
+            return
+
+        known.update(new)
+        async_add_entities(entity for stack in new for entity in factory(stack))
+
+    _async_add_new_stacks()
+    entry.async_on_unload(coordinator.async_add_listener(_async_add_new_stacks))
+
+
 class PortainerBaseEntity(CoordinatorEntity):
     coordinator: PortainerDataCoordinator
 
@@ -22,21 +93,44 @@ class PortainerBaseEntity(CoordinatorEntity):
         container: PortainerContainer,
         id_suffix: str,
     ) -> None:
-        super().__init__(coordinator)
+        # Entities follow the container key (endpoint and name) rather than
+        # its id, so a recreated container keeps its entities and device. The
+        # key is also the listener context so that the coordinator only
+        # dispatches updates for containers that changed.
+        self.container_key = coordinator.container_key(container)
+        super().__init__(coordinator, context=self.container_key)
         self.container = container
-        self.container_id = container.id()
         self.id_suffix = id_suffix
+        self._present = True
+
+    @property
+    def container_id(self) -> str:
+        return self.container.id()
+
+    @property
+    def available(self) -> bool:
+        return (
+            super().available
+            and self._present
+            and self.coordinator.endpoint_available(self.container_key[0])
+        )
 
     @callback
     def _handle_coordinator_update(self) -> None:
         """Update sensor with latest data from coordinator."""
-        # This method is called by your DataUpdateCoordinator when a successful update runs.
-        self.container = self.coordinator.get_container(self.container_id)
+        container = self.coordinator.get_container_by_key(self.container_key)
+
+        # A container that disappeared keeps its last known record and is
+        # unavailable until it is recreated or its device is removed.
+        self._present = container is not None
+
+        if container is not None:
+            self.container = container
 
         _LOGGER.debug(
             "Updating device: %s, %s",
             self.container_id,
-            self.container.name(),
+            self.container_key,
         )
 
         self.async_write_ha_state()
@@ -47,10 +141,116 @@ class PortainerBaseEntity(CoordinatorEntity):
         return DeviceInfo(
             name=self.container.name().removeprefix("/"),
             created_at=self.container.created(),
-            identifiers={(DOMAIN, self.container_id)},
+            identifiers={
+                (DOMAIN, self.coordinator.container_unique_id(self.container_key))
+            },
+        )
+
+    @property
+    def unique_id(self) -> str:
+        """Return unique id."""
+        return f"{DOMAIN}-{self.coordinator.container_unique_id(self.container_key)}-{self.id_suffix}"
+
+
+class PortainerEndpointEntity(CoordinatorEntity):
+    """An entity describing the entry's Portainer environment as a whole."""
+
+    coordinator: PortainerDataCoordinator
+
+    _attr_has_entity_name = True
+
+    def __init__(self, coordinator: PortainerDataCoordinator, id_suffix: str) -> None:
+        super().__init__(coordinator)
+        self.id_suffix = id_suffix
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        return DeviceInfo(
+            name=self.coordinator.config_entry.title,
+            identifiers={(DOMAIN, self.coordinator.config_entry.unique_id)},
+        )
+
+    @property
+    def unique_id(self) -> str:
+        """Return unique id."""
+        return f"{DOMAIN}-{self.coordinator.config_entry.unique_id}-{self.id_suffix}"
+
+
+class PortainerEndpointSummaryEntity(CoordinatorEntity):
+    """An entity of one of the entry's endpoints, in summary mode."""
+
+    coordinator: PortainerDataCoordinator
+
+    _attr_has_entity_name = True
+
+    def __init__(
+        self, coordinator: PortainerDataCoordinator, endpoint_id: int, id_suffix: str
+    ) -> None:
+        # The endpoint id is the listener context, like container keys are.
+        super().__init__(coordinator, context=endpoint_id)
+        self.endpoint_id = endpoint_id
+        self.id_suffix = id_suffix
+
+    @property
+    def available(self) -> bool:
+        return (
+            super().available
+            and self.coordinator.endpoint_available(self.endpoint_id)
+            and self.coordinator.endpoint_summary(self.endpoint_id) is not None
+        )
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        return DeviceInfo(
+            name=self.coordinator.endpoint_name(self.endpoint_id),
+            model="Environment",
+            identifiers={
+                (DOMAIN, self.coordinator.endpoint_unique_id(self.endpoint_id))
+            },
         )
 
     @property
     def unique_id(self) -> str:
         """Return unique id."""
-        return f"{DOMAIN}-{self.container_id}-{self.id_suffix}"
+        endpoint = self.coordinator.endpoint_unique_id(self.endpoint_id)
+
+        return f"{DOMAIN}-{endpoint}-{self.id_suffix}"
+
+
+class PortainerStackEntity(CoordinatorEntity):
+    """An entity of a compose stack, whose containers are grouped by label."""
+
+    coordinator: PortainerDataCoordinator
+
+    _attr_has_entity_name = True
+
+    def __init__(
+        self, coordinator: PortainerDataCoordinator, stack: StackKey, id_suffix: str
+    ) -> None:
+        # The stack key is the listener context, like container keys are.
+        super().__init__(coordinator, context=stack)
+        self.stack = stack
+        self.id_suffix = id_suffix
+
+    @property
+    def available(self) -> bool:
+        return (
+            super().available
+            and self.stack in self.coordinator.stack_keys()
+            and self.coordinator.endpoint_available(self.stack.endpoint_id)
+        )
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        return DeviceInfo(
+            name=self.stack.project,
+            model="Compose stack",
+            identifiers={(DOMAIN, self.coordinator.stack_unique_id(self.stack))},
+        )
+
+    @property
+    def unique_id(self) -> str:
+        """Return unique id."""
+        return (
+            f"{DOMAIN}-{self.coordinator.stack_unique_id(self.stack)}-{self.id_suffix}"
+        )
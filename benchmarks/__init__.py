@@ -0,0 +1,5 @@
+"""Benchmarks for the Portainer integration.
+
+Run from the repository root with Home Assistant installed, e.g.
+``python -m benchmarks.container_index``.
+"""
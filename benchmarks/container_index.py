@@ -0,0 +1,80 @@
+"""Per-tick entity refresh cost against container count.
+
+Compares the previous approach, where every entity rebuilt the container
+list and scanned it, with the coordinator's id index.
+"""
+
+from __future__ import annotations
+
+import time
+
+from .fixtures import import_integration, make_endpoint
+
+api = import_integration("api")
+coordinator = import_integration("coordinator")
+decode = import_integration("decode")
+
+ENTITIES_PER_CONTAINER = 2
+COUNTS = [10, 100, 500, 1000, 2000]
+
+
+class LegacyContainer:
+    """The previous dict wrapping container."""
+
+    def __init__(self, data) -> None:
+        self.snapshot_data = data
+
+    def id(self) -> str:
+        return self.snapshot_data["Id"]
+
+
+def legacy_tick(data) -> None:
+    raw = data["Snapshots"][0]["DockerSnapshotRaw"]["Containers"]
+
+    for container_id in (c["Id"] for c in raw):
+        for _ in range(ENTITIES_PER_CONTAINER):
+            for container in [LegacyContainer(c) for c in raw]:
+                if container.id() == container_id:
+                    break
+
+
+def indexed_tick(data) -> None:
+    # Only the index is exercised, the coordinator itself is not set up.
+    entry = coordinator.PortainerDataCoordinator.__new__(
+        coordinator.PortainerDataCoordinator
+    )
+    entry.selector = None
+    entry._build_index({1: data})
+
+    for key in entry._by_key:
+        for _ in range(ENTITIES_PER_CONTAINER):
+            entry.get_container_by_key(key)
+
+
+def measure(fn, data, repeat: int) -> float:
+    start = time.perf_counter()
+
+    for _ in range(repeat):
+        fn(data)
+
+    return (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+    print(f"{'containers':>10} {'legacy ms':>12} {'indexed ms':>12} {'speedup':>9}")
+
+    for count in COUNTS:
+        data = make_endpoint(1, count)
+        legacy = measure(legacy_tick, data, 1 if count > 500 else 5)
+        indexed = measure(
+            indexed_tick, decode.compact_endpoint(data, api.PortainerContainer), 50
+        )
+
+        print(
+            f"{count:>10} {legacy * 1000:>12.2f} {indexed * 1000:>12.3f} "
+            f"{legacy / indexed:>8.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Memory retained for a large fleet by the coordinator's container data.
+
+Compares keeping the whole endpoint snapshot with dict-wrapping containers,
+as the coordinator used to, against compact endpoints of slotted records.
+"""
+
+from __future__ import annotations
+
+import gc
+import json
+import tracemalloc
+
+from .fixtures import import_integration, make_endpoint, rss
+
+api = import_integration("api")
+decode = import_integration("decode")
+
+COUNTS = [1000, 10000]
+
+
+class LegacyContainer:
+    def __init__(self, data) -> None:
+        self.snapshot_data = data
+
+
+def legacy(body: bytes):
+    endpoint = json.loads(body)
+    containers = endpoint["Snapshots"][0]["DockerSnapshotRaw"]["Containers"]
+
+    return endpoint, [LegacyContainer(c) for c in containers]
+
+
+def compact(body: bytes):
+    return decode.compact_endpoint(json.loads(body), api.PortainerContainer)
+
+
+def retained(fn, body: bytes) -> tuple[int, int | None]:
+    gc.collect()
+    rss_before = rss()
+    tracemalloc.start()
+
+    result = fn(body)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+
+    tracemalloc.stop()
+    rss_after = rss()
+    del result
+
+    return size, (rss_after - rss_before) if rss_before is not None else None
+
+
+def main() -> None:
+    print(
+        f"{'containers':>10}  {'layout':<10} {'retained KiB':>13} {'RSS delta KiB':>14}"
+    )
+
+    for count in COUNTS:
+        body = json.dumps(make_endpoint(1, count)).encode()
+
+        for name, fn in (("legacy", legacy), ("compact", compact)):
+            size, rss_delta = retained(fn, body)
+            rss_text = f"{rss_delta // 1024:>14}" if rss_delta is not None else "n/a"
+
+            print(f"{count:>10}  {name:<10} {size // 1024:>13} {rss_text}")
+
+
+if __name__ == "__main__":
+    main()
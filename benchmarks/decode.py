@@ -0,0 +1,95 @@
+"""Parse time and peak memory of decoding endpoint payloads.
+
+Compares the previous full stdlib json parse with the compact decoding in
+decode.py, both the orjson fallback and, when ijson is installed, the
+streaming decoder.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+import tracemalloc
+
+from homeassistant.util.json import json_loads
+
+from .fixtures import import_integration, make_endpoint
+
+decode = import_integration("decode")
+
+COUNTS = [1000, 10000]
+CHUNK_SIZE = 2**16
+
+
+class ChunkedReader:
+    """Feeds a body in chunks, like aiohttp's StreamReader."""
+
+    def __init__(self, body: bytes) -> None:
+        self._body = body
+        self._offset = 0
+
+    async def read(self, n: int = -1) -> bytes:
+        if n < 0:
+            n = len(self._body)
+
+        chunk = self._body[self._offset : self._offset + min(n, CHUNK_SIZE)]
+        self._offset += len(chunk)
+
+        return chunk
+
+
+def stdlib_full(body: bytes):
+    return json.loads(body)
+
+
+def orjson_compact(body: bytes):
+    return decode.compact_endpoint(json_loads(body))
+
+
+def ijson_stream(body: bytes):
+    return asyncio.run(decode.stream_compact_endpoints(ChunkedReader(body), False))
+
+
+def measure(fn, body: bytes, repeat: int) -> tuple[float, int]:
+    start = time.perf_counter()
+
+    for _ in range(repeat):
+        fn(body)
+
+    elapsed = (time.perf_counter() - start) / repeat
+
+    # Peak memory is measured separately as tracing slows decoding down.
+    tracemalloc.start()
+    result = fn(body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+
+    return elapsed, peak
+
+
+def main() -> None:
+    decoders = {"stdlib json (full)": stdlib_full, "orjson + compact": orjson_compact}
+
+    if decode.ijson is not None:
+        decoders[f"ijson stream ({decode.ijson.backend})"] = ijson_stream
+
+    print(
+        f"{'containers':>10} {'body KiB':>9}  {'decoder':<24} {'ms':>9} {'peak KiB':>9}"
+    )
+
+    for count in COUNTS:
+        body = json.dumps(make_endpoint(1, count)).encode()
+
+        for name, fn in decoders.items():
+            elapsed, peak = measure(fn, body, 5 if count <= 1000 else 2)
+
+            print(
+                f"{count:>10} {len(body) // 1024:>9}  {name:<24} "
+                f"{elapsed * 1000:>9.1f} {peak // 1024:>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Synthetic Portainer payloads and helpers shared by the benchmarks."""
+
+from __future__ import annotations
+
+import importlib
+import os
+from pathlib import Path
+import sys
+from types import ModuleType
+from typing import Any
+
+INTEGRATION_DIR = Path(__file__).resolve().parents[1]
+
+STATES = ["running", "running", "running", "exited", "paused", "created"]
+
+
+def import_integration(module: str) -> ModuleType:
+    """Import a module of the integration as part of its package."""
+    if str(INTEGRATION_DIR.parent) not in sys.path:
+        sys.path.insert(0, str(INTEGRATION_DIR.parent))
+
+    return importlib.import_module(f"{INTEGRATION_DIR.name}.{module}")
+
+
+def rss() -> int | None:
+    """Resident set size in bytes, where /proc is available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+def make_container(i: int) -> dict[str, Any]:
+    state = STATES[i % len(STATES)]
+
+    return {
+        "Id": f"{i:064x}",
+        "Names": [f"/container-{i}"],
+        "Image": f"registry.local/app-{i % 20}:latest",
+        "ImageID": f"sha256:{i % 20:064x}",
+        "Command": "/entrypoint.sh",
+        "Created": 1700000000 + i,
+        "State": state,
+        "Status": "Up 3 hours" if state == "running" else "Exited (0) 2 hours ago",
+        "Ports": [],
+        "Labels": {
+            "com.docker.compose.project": f"stack-{i % 25}",
+            "com.docker.compose.service": f"service-{i}",
+        },
+        "HostConfig": {"NetworkMode": "bridge"},
+        "NetworkSettings": {"Networks": {"bridge": {"IPAddress": "172.17.0.2"}}},
+        "Mounts": [],
+    }
+
+
+def make_endpoint(endpoint_id: int, containers: int) -> dict[str, Any]:
+    return {
+        "Id": endpoint_id,
+        "Name": f"endpoint-{endpoint_id}",
+        "URL": "unix:///var/run/docker.sock",
+        "Type": 1,
+        "Status": 1,
+        "Snapshots": [
+            {
+                "Time": 1700000000,
+                "DockerVersion": "27.0.3",
+                "RunningContainerCount": sum(
+                    STATES[i % len(STATES)] == "running" for i in range(containers)
+                ),
+                "StoppedContainerCount": sum(
+                    STATES[i % len(STATES)] == "exited" for i in range(containers)
+                ),
+                "HealthyContainerCount": 0,
+                "UnhealthyContainerCount": 0,
+                "ImageCount": 20,
+                "VolumeCount": 0,
+                "StackCount": 25,
+                "DockerSnapshotRaw": {
+                    "Containers": [make_container(i) for i in range(containers)],
+                    "Images": [],
+                    "Volumes": {"Volumes": []},
+                    "Networks": [],
+                    "Info": {},
+                    "Version": {},
+                },
+            }
+        ],
+    }
@@ -0,0 +1,270 @@
+"""Refresh cost of a whole fleet against a local stub Portainer.
+
+Drives a real PortainerAPI, hub and entry coordinator against the stub in
+stub_server.py for fleets of 10 to 10,000 containers, in snapshot, live
+listing and summary mode. Between ticks a fraction of the containers change
+state. Every container gets two probe listeners standing in for its sensor
+and switch, in summary mode every endpoint gets one per summary sensor, so
+entity writes are counted the way the coordinator dispatches them.
+
+Per fleet size it reports tick latency, the longest time the event loop was
+blocked during a tick, entity writes per tick, the peak allocations of a
+tick and the process RSS. Results are also written as JSON, by default to
+fleet-results.json, so that runs can be compared over time:
+
+    python -m benchmarks.fleet --counts 10,1000 --output before.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from datetime import UTC, datetime
+import json
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+from typing import Any
+from unittest.mock import patch
+
+import aiohttp
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import __version__ as HA_VERSION
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import frame
+
+from .fixtures import import_integration, rss
+from .stub_server import StubPortainer
+
+coordinator = import_integration("coordinator")
+
+COUNTS = [10, 100, 1000, 10000]
+TICKS = 20
+CHURN = 0.01
+# The loop monitor wakes up this often, anything later counts as blocking.
+MONITOR_INTERVAL = 0.001
+# Listeners per container: a status sensor and a running switch
+ENTITIES_PER_CONTAINER = 2
+# Listeners per endpoint in summary mode, one per summary sensor
+ENTITIES_PER_ENDPOINT = 7
+# Mode -> entry options
+MODES = {
+    "snapshot": {},
+    "live": {"live_containers": True},
+    "summary": {"summary_only": True},
+}
+
+
+class LoopMonitor:
+    """Measures how late the event loop runs a task that sleeps briefly."""
+
+    def __init__(self) -> None:
+        self.max_lag = 0.0
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(MONITOR_INTERVAL)
+            lag = time.perf_counter() - start - MONITOR_INTERVAL
+            self.max_lag = max(self.max_lag, lag)
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def reset(self) -> None:
+        self.max_lag = 0.0
+
+    def stop(self) -> None:
+        self._task.cancel()
+
+
+def _summary(values: list[float]) -> dict[str, float]:
+    ordered = sorted(values)
+
+    return {
+        "mean": round(statistics.fmean(ordered), 3),
+        "p50": round(ordered[len(ordered) // 2], 3),
+        "p95": round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)], 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def _entry(port: int, endpoints: int, mode: str) -> ConfigEntry:
+    data = {
+        "host": "127.0.0.1",
+        "port": str(port),
+        "api_key": "benchmark",
+        "ssl": False,
+        "verify_ssl": False,
+        "instance_id": "stub",
+    }
+
+    if endpoints == 1:
+        data["endpoint_id"] = 1
+    else:
+        data["endpoint_ids"] = list(range(1, endpoints + 1))
+
+    return ConfigEntry(
+        version=1,
+        minor_version=0,
+        domain=coordinator.DOMAIN,
+        title="benchmark",
+        data=data,
+        source="user",
+        options=MODES[mode],
+        unique_id=f"stub-{mode}",
+        discovery_keys={},
+        subentries_data=None,
+    )
+
+
+async def run_fleet(
+    count: int, endpoints: int, mode: str, ticks: int, churn: float
+) -> dict[str, Any]:
+    stub = StubPortainer(endpoints, count)
+    port = stub.start()
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant(config_dir)
+        frame.async_setup(hass)
+
+        entry = _entry(port, endpoints, mode)
+        # Home Assistant's shared session needs the network integration, the
+        # hub gets a plain one instead. Ticks are driven by the benchmark
+        # rather than by timers.
+        session = aiohttp.ClientSession()
+        with patch.object(coordinator, "async_get_clientsession", return_value=session):
+            hub = coordinator.async_get_hub(hass, entry)
+        hub._schedule_refresh = lambda: None
+
+        data = coordinator.PortainerDataCoordinator(hass, entry, hub)
+        await data.async_load_environments()
+        data.attach()
+        await data.async_refresh()
+
+        writes = 0
+
+        def write() -> None:
+            nonlocal writes
+            writes += 1
+
+        if data.summary_only:
+            contexts = data.environments * ENTITIES_PER_ENDPOINT
+        else:
+            contexts = list(data.container_keys()) * ENTITIES_PER_CONTAINER
+
+        for context in contexts:
+            data.async_add_listener(write, context)
+
+        monitor = LoopMonitor()
+        monitor.start()
+        latencies, blocking, tick_writes = [], [], []
+
+        for _ in range(ticks):
+            stub.call(stub.churn, churn)
+            await asyncio.sleep(0)
+            monitor.reset()
+            writes = 0
+
+            start = time.perf_counter()
+            await hub.async_refresh()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+            # Let the monitor observe the end of the tick.
+            await asyncio.sleep(MONITOR_INTERVAL * 2)
+            blocking.append(monitor.max_lag * 1000)
+            tick_writes.append(writes)
+
+        monitor.stop()
+
+        # Tracing slows everything down, so allocations get a tick of their
+        # own.
+        stub.call(stub.churn, churn)
+        tracemalloc.start()
+        await hub.async_refresh()
+        alloc_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        result = {
+            "containers": count,
+            "endpoints": endpoints,
+            "mode": mode,
+            "ticks": ticks,
+            "churn": churn,
+            "success": hub.last_update_success,
+            "tick_ms": _summary(latencies),
+            "loop_blocked_ms": _summary(blocking),
+            "entity_writes_per_tick": round(statistics.fmean(tick_writes), 1),
+            "alloc_peak_kib": alloc_peak // 1024,
+            "rss_mib": round(rss() / 2**20, 1) if rss() is not None else None,
+            "bytes_per_tick": hub.api.metrics.bytes_received // (ticks + 2),
+            "requests": dict(stub.requests),
+        }
+
+        await coordinator.async_release_hub(hass, data)
+        await session.close()
+        await hass.async_stop(force=True)
+
+    stub.stop()
+
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--counts",
+        default=",".join(map(str, COUNTS)),
+        help="comma separated fleet sizes",
+    )
+    parser.add_argument("--endpoints", type=int, default=1)
+    parser.add_argument("--ticks", type=int, default=TICKS)
+    parser.add_argument("--churn", type=float, default=CHURN)
+    parser.add_argument("--mode", choices=[*MODES, "all"], default="all")
+    parser.add_argument("--output", default="fleet-results.json")
+    args = parser.parse_args()
+
+    modes = list(MODES) if args.mode == "all" else [args.mode]
+    results = []
+
+    print(
+        f"{'containers':>10} {'mode':<9} {'tick p50':>9} {'tick p95':>9} "
+        f"{'blocked':>8} {'writes':>7} {'alloc KiB':>10} {'RSS MiB':>8}"
+    )
+
+    for count in (int(c) for c in args.counts.split(",")):
+        for mode in modes:
+            r = asyncio.run(
+                run_fleet(count, args.endpoints, mode, args.ticks, args.churn)
+            )
+            results.append(r)
+
+            print(
+                f"{count:>10} {r['mode']:<9} {r['tick_ms']['p50']:>9.2f} "
+                f"{r['tick_ms']['p95']:>9.2f} {r['loop_blocked_ms']['max']:>8.2f} "
+                f"{r['entity_writes_per_tick']:>7} {r['alloc_peak_kib']:>10} "
+                f"{r['rss_mib']:>8}"
+            )
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "benchmark": "fleet",
+                "timestamp": datetime.now(UTC).isoformat(),
+                "python": platform.python_version(),
+                "homeassistant": HA_VERSION,
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
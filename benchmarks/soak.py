@@ -0,0 +1,386 @@
+"""Soak test of the API client and coordinators under injected faults.
+
+Runs the hub with a snapshot environment and a live one, and the stats
+coordinator, against a stub Portainer served over TLS. Hours of ticks are
+simulated: the clock used for polling, circuit breaking and stats moves
+ahead by each tick's poll interval, while requests still go over real
+sockets. Timeouts and retry delays are shortened to match.
+
+The stub cycles through phases of latency, timeouts, 5xx errors, truncated
+bodies, an untrusted certificate, an outage and flapping availability, with
+a healthy phase in between. The run fails when:
+
+- traced memory keeps growing from one simulated hour to the next,
+- tasks, client sessions or server connections pile up or outlive the hub,
+- a faulty phase makes more requests per minute than a healthy one would
+  with every request retried,
+- a healthy phase does not end with a successful refresh.
+
+    python -m benchmarks.soak --hours 6 --output soak.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from datetime import timedelta
+import gc
+import json
+import logging
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Any
+from unittest.mock import patch
+
+import aiohttp
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import frame
+
+from .fixtures import import_integration
+from .stub_server import Faults, StubPortainer
+
+api = import_integration("api")
+coordinator = import_integration("coordinator")
+resilience = import_integration("resilience")
+stats = import_integration("stats")
+
+CONTAINERS = 200
+HOURS = 4
+PHASE = timedelta(minutes=20)
+FLAP_PERIOD = timedelta(minutes=2)
+CHURN = 0.02
+# Real time limits, the stub holds timed out requests for longer
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=0.1)
+FETCH_TIMEOUT = timedelta(seconds=0.5)
+
+PHASES: list[tuple[str, Faults | None]] = [
+    ("healthy", Faults()),
+    ("latency", Faults(latency=0.02)),
+    ("healthy", Faults()),
+    ("timeouts", Faults(timeout=0.3)),
+    ("healthy", Faults()),
+    ("server errors", Faults(server_error=0.3)),
+    ("healthy", Faults()),
+    ("truncated bodies", Faults(truncated=0.3)),
+    ("healthy", Faults()),
+    ("bad certificate", Faults(bad_certificate=True)),
+    ("healthy", Faults()),
+    ("outage", Faults(down=True)),
+    ("healthy", Faults()),
+    # Availability is toggled every FLAP_PERIOD
+    ("flapping", None),
+]
+
+MEMORY_GROWTH_LIMIT = 2 * 2**20
+TASK_SLACK = 2
+CONNECTION_LIMIT = 8
+
+
+class Clock:
+    """Simulated time for the modules that schedule with time.monotonic()."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def module(self) -> SimpleNamespace:
+        return SimpleNamespace(
+            monotonic=lambda: self.now, perf_counter=time.perf_counter
+        )
+
+
+def _entry(port: int, endpoint_id: int, live: bool) -> ConfigEntry:
+    return ConfigEntry(
+        version=1,
+        minor_version=0,
+        domain=coordinator.DOMAIN,
+        title=f"endpoint-{endpoint_id}",
+        data={
+            "host": "127.0.0.1",
+            "port": str(port),
+            "api_key": "soak",
+            "ssl": True,
+            "verify_ssl": True,
+            "instance_id": "stub",
+            "endpoint_id": endpoint_id,
+        },
+        source="user",
+        options={"live_containers": live},
+        unique_id=f"stub-e{endpoint_id}",
+        discovery_keys={},
+        subentries_data=None,
+    )
+
+
+def _open_sessions() -> int:
+    return sum(
+        1
+        for o in gc.get_objects()
+        if isinstance(o, aiohttp.ClientSession) and not o.closed
+    )
+
+
+def _phase(clock: Clock) -> tuple[int, str, Faults]:
+    index = int(clock.now // PHASE.total_seconds())
+    name, faults = PHASES[index % len(PHASES)]
+
+    if faults is None:
+        faults = Faults(down=int(clock.now // FLAP_PERIOD.total_seconds()) % 2 == 1)
+
+    return index, name, faults
+
+
+async def soak(hours: float, containers: int, seed: int) -> dict[str, Any]:
+    rand = random.Random(seed)
+    clock = Clock()
+    stub = StubPortainer(2, containers, seed=seed, tls=True)
+    port = stub.start()
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(ssl=stub.client_ssl_context())
+    )
+
+    with (
+        tempfile.TemporaryDirectory() as config_dir,
+        patch.object(coordinator, "async_get_clientsession", return_value=session),
+        patch.object(coordinator, "time", clock.module()),
+        patch.object(resilience, "time", clock.module()),
+        patch.object(stats, "time", clock.module()),
+        patch.object(coordinator, "ENDPOINT_FETCH_TIMEOUT", FETCH_TIMEOUT),
+        patch.object(stats, "STATS_ROUND_TIMEOUT", FETCH_TIMEOUT),
+        patch.object(api, "REQUEST_TIMEOUT", REQUEST_TIMEOUT),
+        patch.object(api, "STATS_TIMEOUT", REQUEST_TIMEOUT),
+        patch.object(api, "retry_delay", lambda attempt: 0),
+    ):
+        hass = HomeAssistant(config_dir)
+        frame.async_setup(hass)
+        tasks_before = len(asyncio.all_tasks())
+
+        entries = [_entry(port, 1, False), _entry(port, 2, True)]
+        hub = coordinator.async_get_hub(hass, entries[0])
+        hub._schedule_refresh = lambda: None
+        data_coordinators = []
+
+        for entry in entries:
+            data = coordinator.PortainerDataCoordinator(hass, entry, hub)
+            await data.async_load_environments()
+            data.attach()
+            data_coordinators.append(data)
+
+        await hub.async_refresh()
+
+        stats_coordinator = stats.ContainerStatsCoordinator(
+            hass, entries[1], data_coordinators[1]
+        )
+        stats_coordinator._schedule_refresh = lambda: None
+
+        for data in data_coordinators:
+            for key in data.container_keys():
+                data.async_add_listener(lambda: None, key)
+
+        for key in sorted(data_coordinators[1].container_keys())[:10]:
+            stats_coordinator.async_add_listener(lambda: None, key)
+
+        tasks_baseline = len(asyncio.all_tasks())
+        tracemalloc.start()
+
+        phases: list[dict[str, Any]] = []
+        checkpoints: list[dict[str, Any]] = []
+        next_checkpoint = 0.0
+        next_stats = 0.0
+        end = hours * 3600
+
+        while clock.now < end:
+            index, name, faults = _phase(clock)
+
+            if not phases or phases[-1]["index"] != index:
+                phases.append(
+                    {
+                        "phase": name,
+                        "index": index,
+                        "ticks": 0,
+                        "failed_ticks": 0,
+                        "requests": 0,
+                        "circuit_open_ticks": 0,
+                    }
+                )
+
+            phase = phases[-1]
+            stub.faults = faults
+
+            if rand.random() < 0.5:
+                stub.call(stub.churn, CHURN)
+
+            requests = sum(stub.requests.values())
+            await hub.async_refresh()
+
+            if clock.now >= next_stats:
+                await stats_coordinator.async_refresh()
+                next_stats = clock.now + stats.STATS_INTERVAL.total_seconds()
+
+            phase["ticks"] += 1
+            phase["requests"] += sum(stub.requests.values()) - requests
+            phase["failed_ticks"] += not hub.last_update_success
+            phase["circuit_open_ticks"] += (
+                hub.api.circuit.state != resilience.CircuitBreaker.CLOSED
+            )
+            phase["last_success"] = hub.last_update_success
+
+            if clock.now >= next_checkpoint:
+                gc.collect()
+                checkpoints.append(
+                    {
+                        "hour": round(clock.now / 3600, 2),
+                        "traced_kib": tracemalloc.get_traced_memory()[0] // 1024,
+                        "tasks": len(asyncio.all_tasks()),
+                        "sessions": _open_sessions(),
+                        "connections": stub.connections(),
+                    }
+                )
+                next_checkpoint += 3600
+
+            clock.now += hub._next_interval().total_seconds()
+
+        tracemalloc.stop()
+
+        for data in data_coordinators:
+            await coordinator.async_release_hub(hass, data)
+
+        await stats_coordinator.async_shutdown()
+        await session.close()
+        await asyncio.sleep(0)
+        tasks_after = len(asyncio.all_tasks())
+        sessions_after = _open_sessions()
+
+        await hass.async_stop(force=True)
+
+    handshakes = stub.handshakes
+    stub.stop()
+
+    failures = _check(
+        phases,
+        checkpoints,
+        tasks_baseline,
+        tasks_before,
+        tasks_after,
+        sessions_after,
+    )
+
+    return {
+        "hours": hours,
+        "containers": containers,
+        "seed": seed,
+        "handshakes": handshakes,
+        "phases": phases,
+        "checkpoints": checkpoints,
+        "failures": failures,
+    }
+
+
+def _check(
+    phases: list[dict[str, Any]],
+    checkpoints: list[dict[str, Any]],
+    tasks_baseline: int,
+    tasks_before: int,
+    tasks_after: int,
+    sessions_after: int,
+) -> list[str]:
+    failures = []
+    minutes = PHASE.total_seconds() / 60
+
+    # The first hour warms up caches and interned strings.
+    if len(checkpoints) > 2:
+        growth = (checkpoints[-1]["traced_kib"] - checkpoints[1]["traced_kib"]) * 1024
+
+        if growth > MEMORY_GROWTH_LIMIT:
+            failures.append(f"Traced memory grew by {growth // 1024} KiB")
+
+    for checkpoint in checkpoints:
+        if checkpoint["tasks"] > tasks_baseline + TASK_SLACK:
+            failures.append(f"{checkpoint['tasks']} tasks at {checkpoint['hour']}h")
+        if checkpoint["sessions"] > 1:
+            failures.append(
+                f"{checkpoint['sessions']} sessions at {checkpoint['hour']}h"
+            )
+        if checkpoint["connections"] > CONNECTION_LIMIT:
+            failures.append(
+                f"{checkpoint['connections']} connections at {checkpoint['hour']}h"
+            )
+
+    if tasks_after > tasks_before:
+        failures.append(f"{tasks_after - tasks_before} tasks left after shutdown")
+    if sessions_after:
+        failures.append(f"{sessions_after} sessions left open after shutdown")
+
+    # Only complete phases say something about rates.
+    complete = phases[:-1]
+    healthy = [p["requests"] for p in complete if p["phase"] == "healthy"]
+
+    if healthy:
+        limit = max(healthy) / minutes * (resilience.GET_RETRIES + 1)
+
+        for p in complete:
+            p["requests_per_minute"] = round(p["requests"] / minutes, 1)
+
+            if p["requests_per_minute"] > limit:
+                failures.append(
+                    f"{p['phase']} made {p['requests_per_minute']} requests per "
+                    f"minute, limit {limit:.1f}"
+                )
+            if p["phase"] == "healthy" and not p["last_success"]:
+                failures.append(f"Healthy phase {p['index']} did not recover")
+
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hours", type=float, default=HOURS)
+    parser.add_argument("--containers", type=int, default=CONTAINERS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="soak-results.json")
+    parser.add_argument(
+        "--verbose", action="store_true", help="log the failures as they happen"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING if args.verbose else logging.CRITICAL)
+
+    start = time.perf_counter()
+    result = asyncio.run(soak(args.hours, args.containers, args.seed))
+    result["duration"] = round(time.perf_counter() - start, 1)
+
+    print(f"{'phase':<17} {'ticks':>6} {'failed':>7} {'circuit':>8} {'req/min':>8}")
+
+    for p in result["phases"]:
+        print(
+            f"{p['phase']:<17} {p['ticks']:>6} {p['failed_ticks']:>7} "
+            f"{p['circuit_open_ticks']:>8} {p.get('requests_per_minute', '-'):>8}"
+        )
+
+    print()
+
+    for c in result["checkpoints"]:
+        print(
+            f"{c['hour']:>5}h traced {c['traced_kib']} KiB, {c['tasks']} tasks, "
+            f"{c['sessions']} sessions, {c['connections']} connections"
+        )
+
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(
+        f"\nSimulated {args.hours}h in {result['duration']}s, "
+        f"results written to {args.output}"
+    )
+
+    for failure in result["failures"]:
+        print(f"FAIL: {failure}")
+
+    sys.exit(1 if result["failures"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Time to ready of an entry, with and without the saved snapshot cache.
+
+Sets up the hub and entry coordinator the way async_setup_entry does,
+against the stub in stub_server.py with added latency, and measures how
+long it takes until the entry has data to create its entities from:
+
+- cold: no saved endpoints, the environments are listed and the first
+  refresh is awaited,
+- warm: the endpoints saved by the cold run are restored, the first refresh
+  is left to run in the background,
+- offline: like warm, but Portainer is down.
+
+    python -m benchmarks.startup --containers 1000 --latency 0.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import tempfile
+import time
+from typing import Any
+from unittest.mock import patch
+
+import aiohttp
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import frame
+
+from .fixtures import import_integration
+from .stub_server import Faults, StubPortainer
+
+coordinator = import_integration("coordinator")
+
+CONTAINERS = 1000
+ENDPOINTS = 2
+LATENCY = 0.2
+RUNS = 5
+
+
+def _entry(port: int) -> ConfigEntry:
+    return ConfigEntry(
+        version=1,
+        minor_version=0,
+        domain=coordinator.DOMAIN,
+        title="benchmark",
+        data={
+            "host": "127.0.0.1",
+            "port": str(port),
+            "api_key": "benchmark",
+            "ssl": False,
+            "verify_ssl": False,
+            "instance_id": "stub",
+            "all_endpoints": True,
+        },
+        source="user",
+        options={},
+        unique_id="stub-all",
+        discovery_keys={},
+        subentries_data=None,
+    )
+
+
+async def _start(config_dir: str, port: int, restore: bool) -> tuple[float, int]:
+    """Set up an entry in a fresh Home Assistant, return when it was ready."""
+    hass = HomeAssistant(config_dir)
+    frame.async_setup(hass)
+    session = aiohttp.ClientSession()
+
+    with patch.object(coordinator, "async_get_clientsession", return_value=session):
+        entry = _entry(port)
+        start = time.perf_counter()
+        hub = coordinator.async_get_hub(hass, entry)
+        hub._schedule_refresh = lambda: None
+        data = coordinator.PortainerDataCoordinator(hass, entry, hub)
+        await data.async_load_environments()
+        data.attach()
+
+        if not (restore and await data.async_restore()):
+            await data.async_refresh()
+
+        ready = time.perf_counter() - start
+        containers = len(data.get_containers())
+
+        # Releasing the hub writes its pending save for the next run.
+        await coordinator.async_release_hub(hass, data)
+
+    await session.close()
+    await hass.async_stop(force=True)
+
+    return ready, containers
+
+
+async def startup(containers: int, latency: float, runs: int) -> dict[str, Any]:
+    stub = StubPortainer(ENDPOINTS, containers)
+    port = stub.start()
+    results: dict[str, list[float]] = {"cold": [], "warm": [], "offline": []}
+    counts: dict[str, int] = {}
+
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as config_dir:
+            stub.faults = Faults(latency=latency)
+            ready, counts["cold"] = await _start(config_dir, port, restore=False)
+            results["cold"].append(ready)
+
+            ready, counts["warm"] = await _start(config_dir, port, restore=True)
+            results["warm"].append(ready)
+
+            stub.faults = Faults(down=True)
+            ready, counts["offline"] = await _start(config_dir, port, restore=True)
+            results["offline"].append(ready)
+
+    stub.stop()
+
+    return {
+        mode: {
+            "ready_ms": round(min(times) * 1000, 2),
+            "containers": counts[mode],
+        }
+        for mode, times in results.items()
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--containers", type=int, default=CONTAINERS)
+    parser.add_argument(
+        "--latency", type=float, default=LATENCY, help="seconds added per request"
+    )
+    parser.add_argument("--runs", type=int, default=RUNS)
+    args = parser.parse_args()
+
+    result = asyncio.run(startup(args.containers, args.latency, args.runs))
+
+    print(f"{'mode':<8} {'ready ms':>9} {'containers':>11}")
+
+    for mode, r in result.items():
+        print(f"{mode:<8} {r['ready_ms']:>9} {r['containers']:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+"""A local stub of the Portainer API serving a synthetic fleet.
+
+The stub runs its own event loop in a background thread, so that serving
+large payloads does not count towards the event loop blocking measured in
+the integration's loop. Faults can be injected into its responses, see
+Faults.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+import ipaddress
+import json
+from pathlib import Path
+import random
+import ssl
+import tempfile
+import threading
+from typing import Any
+
+from aiohttp import web
+
+from .fixtures import STATES, make_endpoint
+
+
+@dataclass
+class Faults:
+    """Faults injected into the stub's responses.
+
+    Chances are per request. A request that times out is held for
+    StubPortainer.hang seconds, longer than the client is expected to wait.
+    """
+
+    latency: float = 0.0
+    timeout: float = 0.0
+    server_error: float = 0.0
+    truncated: float = 0.0
+    # Drop every connection without a response
+    down: bool = False
+    # Present an untrusted certificate, only when serving TLS
+    bad_certificate: bool = False
+
+
+def _self_signed(directory: Path, name: str) -> tuple[Path, Path]:
+    """Write a self-signed certificate for 127.0.0.1 and its key."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+    now = datetime.now(UTC)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=1))
+        .add_extension(
+            x509.SubjectAlternativeName(
+                [x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]
+            ),
+            critical=False,
+        )
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), True)
+        .sign(key, hashes.SHA256())
+    )
+
+    cert_path = directory / f"{name}.pem"
+    key_path = directory / f"{name}.key"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+
+    return cert_path, key_path
+
+
+class StubPortainer:
+    """Serves endpoints whose containers change state on every churn()."""
+
+    def __init__(
+        self, endpoints: int, containers: int, seed: int = 0, tls: bool = False
+    ) -> None:
+        per_endpoint = max(containers // endpoints, 1)
+        self.endpoints = {
+            i: make_endpoint(i, per_endpoint) for i in range(1, endpoints + 1)
+        }
+        # Docker ids are unique per host, keep them unique across endpoints.
+        for endpoint_id, endpoint in self.endpoints.items():
+            for container in self.containers(endpoint_id):
+                container["Id"] = f"{endpoint_id:08x}{container['Id'][8:]}"
+
+        # Every compose project is a stack Portainer manages
+        self.stacks = [
+            {
+                "Id": i,
+                "Name": project,
+                "EndpointId": endpoint_id,
+                "Type": 2,
+                "Status": 1,
+            }
+            for i, (endpoint_id, project) in enumerate(
+                sorted(
+                    {
+                        (endpoint_id, c["Labels"]["com.docker.compose.project"])
+                        for endpoint_id in self.endpoints
+                        for c in self.containers(endpoint_id)
+                    }
+                ),
+                start=1,
+            )
+        ]
+        self.requests: dict[str, int] = {}
+        self.faults = Faults()
+        self.hang = 0.5
+        self.handshakes = 0
+        self._random = random.Random(seed)
+        self._tls = tls
+        self._certs: tempfile.TemporaryDirectory | None = None
+        self._trusted: Path | None = None
+        self._bodies: dict[Any, bytes] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._runner: web.AppRunner | None = None
+        self._thread: threading.Thread | None = None
+        self.port: int | None = None
+
+    def containers(self, endpoint_id: int) -> list[dict[str, Any]]:
+        return self.endpoints[endpoint_id]["Snapshots"][0]["DockerSnapshotRaw"][
+            "Containers"
+        ]
+
+    def churn(self, fraction: float) -> int:
+        """Change the state of a fraction of every endpoint's containers."""
+        changed = 0
+
+        for endpoint_id in self.endpoints:
+            containers = self.containers(endpoint_id)
+
+            for container in self._random.sample(
+                containers, max(int(len(containers) * fraction), 1)
+            ):
+                container["State"] = self._random.choice(
+                    [s for s in STATES if s != container["State"]]
+                )
+                changed += 1
+
+        # Bodies are serialized once per churn, not once per request.
+        self._bodies.clear()
+
+        return changed
+
+    def _body(self, key: Any, build) -> bytes:
+        if key not in self._bodies:
+            self._bodies[key] = json.dumps(build()).encode()
+
+        return self._bodies[key]
+
+    def _json(self, key: Any, build) -> web.Response:
+        return web.Response(
+            body=self._body(key, build), content_type="application/json"
+        )
+
+    def _count(self, request: web.Request) -> None:
+        route = request.match_info.route.resource.canonical
+        self.requests[route] = self.requests.get(route, 0) + 1
+
+    @web.middleware
+    async def _inject_faults(self, request: web.Request, handler) -> web.Response:
+        self._count(request)
+        faults = self.faults
+
+        if faults.down or faults.bad_certificate:
+            # The client reconnects, which is when a certificate is checked.
+            request.transport.abort()
+            raise asyncio.CancelledError
+
+        if faults.latency:
+            await asyncio.sleep(faults.latency)
+
+        if self._random.random() < faults.timeout:
+            await asyncio.sleep(self.hang)
+
+        if self._random.random() < faults.server_error:
+            raise web.HTTPServiceUnavailable
+
+        response = await handler(request)
+
+        if self._random.random() < faults.truncated and response.body:
+            # Cut short with a matching length, so only the JSON is broken.
+            return web.Response(
+                body=response.body[: len(response.body) // 2],
+                content_type=response.content_type,
+            )
+
+        return response
+
+    async def _system_status(self, request: web.Request) -> web.Response:
+        return web.json_response({"Version": "2.21.0", "InstanceID": "stub"})
+
+    async def _endpoints(self, request: web.Request) -> web.Response:
+        # Like Portainer, only the [] form of array parameters is read.
+        ids = tuple(int(i) for i in request.query.getall("endpointIds[]", []))
+        ids = ids or tuple(self.endpoints)
+
+        return self._json(ids, lambda: [self.endpoints[i] for i in ids])
+
+    async def _endpoint(self, request: web.Request) -> web.Response:
+        endpoint_id = int(request.match_info["endpoint_id"])
+
+        if endpoint_id not in self.endpoints:
+            raise web.HTTPNotFound
+
+        return self._json(endpoint_id, lambda: self.endpoints[endpoint_id])
+
+    async def _containers(self, request: web.Request) -> web.Response:
+        endpoint_id = int(request.match_info["endpoint_id"])
+
+        if endpoint_id not in self.endpoints:
+            raise web.HTTPNotFound
+
+        # Only label filters are applied, ANDed like the daemon does.
+        filters = json.loads(request.query.get("filters", "{}"))
+        labels = tuple(label.partition("=") for label in filters.get("label", []))
+
+        def listing() -> list[dict[str, Any]]:
+            return [
+                c
+                for c in self.containers(endpoint_id)
+                if all(
+                    key in c["Labels"] and (not value or c["Labels"][key] == value)
+                    for key, _, value in labels
+                )
+            ]
+
+        return self._json(("containers", endpoint_id, labels), listing)
+
+    def _find(self, request: web.Request) -> dict[str, Any]:
+        endpoint_id = int(request.match_info["endpoint_id"])
+        container_id = request.match_info["container_id"]
+
+        for container in self.containers(endpoint_id):
+            if container["Id"] == container_id:
+                return container
+
+        raise web.HTTPNotFound
+
+    async def _inspect(self, request: web.Request) -> web.Response:
+        container = self._find(request)
+
+        return web.json_response(
+            {"Id": container["Id"], "State": {"Status": container["State"]}}
+        )
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        self._find(request)
+        sample = self.requests[request.match_info.route.resource.canonical]
+
+        return web.json_response(
+            {
+                "cpu_stats": {
+                    "cpu_usage": {"total_usage": sample * 10**7},
+                    "system_cpu_usage": sample * 10**9,
+                    "online_cpus": 4,
+                },
+                "memory_stats": {"usage": 64 * 2**20, "limit": 2**30, "stats": {}},
+                "networks": {"eth0": {"rx_bytes": sample, "tx_bytes": sample}},
+            }
+        )
+
+    async def _action(self, request: web.Request) -> web.Response:
+        container = self._find(request)
+        action = request.match_info["action"]
+        container["State"] = {
+            "start": "running",
+            "restart": "running",
+            "unpause": "running",
+            "stop": "exited",
+            "pause": "paused",
+        }[action]
+        self._bodies.clear()
+
+        return web.Response(status=204)
+
+    async def _stacks(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stacks)
+
+    async def _stack_action(self, request: web.Request) -> web.Response:
+        stack_id = int(request.match_info["stack_id"])
+        stack = next((s for s in self.stacks if s["Id"] == stack_id), None)
+
+        if stack is None or int(request.query["endpointId"]) != stack["EndpointId"]:
+            raise web.HTTPNotFound
+
+        start = request.match_info["action"] == "start"
+
+        if stack["Status"] == (1 if start else 2):
+            raise web.HTTPBadRequest
+
+        stack["Status"] = 1 if start else 2
+
+        for container in self.containers(stack["EndpointId"]):
+            if container["Labels"]["com.docker.compose.project"] == stack["Name"]:
+                container["State"] = "running" if start else "exited"
+
+        self._bodies.clear()
+
+        return web.json_response(stack)
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._inject_faults])
+        container = "/api/endpoints/{endpoint_id}/docker/containers/{container_id}"
+        app.router.add_get("/api/system/status", self._system_status)
+        app.router.add_get("/api/endpoints", self._endpoints)
+        app.router.add_get("/api/endpoints/{endpoint_id}", self._endpoint)
+        app.router.add_get(
+            "/api/endpoints/{endpoint_id}/docker/containers/json", self._containers
+        )
+        app.router.add_get(f"{container}/json", self._inspect)
+        app.router.add_get(f"{container}/stats", self._stats)
+        app.router.add_post(
+            container + "/{action:start|stop|restart|pause|unpause}", self._action
+        )
+        app.router.add_get("/api/stacks", self._stacks)
+        app.router.add_post(
+            "/api/stacks/{stack_id}/{action:start|stop}", self._stack_action
+        )
+
+        return app
+
+    def client_ssl_context(self) -> ssl.SSLContext:
+        """A client context trusting the stub's regular certificate."""
+        return ssl.create_default_context(cafile=self._trusted)
+
+    def _server_ssl_context(self) -> ssl.SSLContext:
+        self._certs = tempfile.TemporaryDirectory()
+        directory = Path(self._certs.name)
+        self._trusted, key = _self_signed(directory, "trusted")
+        untrusted = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        untrusted.load_cert_chain(*_self_signed(directory, "untrusted"))
+
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self._trusted, key)
+
+        def choose(ssl_object, server_name, context) -> None:
+            self.handshakes += 1
+
+            if self.faults.bad_certificate:
+                ssl_object.context = untrusted
+
+        context.sni_callback = choose
+
+        return context
+
+    def start(self) -> int:
+        """Start serving on a free local port in a background thread."""
+        started = threading.Event()
+
+        def run() -> None:
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="stub-portainer", daemon=True)
+        self._thread.start()
+        started.wait()
+
+        return self.port
+
+    async def _start(self) -> None:
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(
+            self._runner,
+            "127.0.0.1",
+            0,
+            ssl_context=self._server_ssl_context() if self._tls else None,
+        )
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+        if self._certs is not None:
+            self._certs.cleanup()
+
+    def connections(self) -> int:
+        """The number of connections the stub has open."""
+        return len(self._runner.server.connections)
+
+    def call(self, fn, *args):
+        """Run a function in the stub's thread, e.g. churn()."""
+
+        async def run():
+            return fn(*args)
+
+        return asyncio.run_coroutine_threadsafe(run(), self._loop).result()
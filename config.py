@@ -1,3 +1,6 @@
+from collections.abc import Mapping
+from typing import Any
+
 from homeassistant.const import (
     CONF_API_KEY,
     CONF_HOST,
@@ -6,7 +9,23 @@ from homeassistant.const import (
     CONF_VERIFY_SSL,
 )
 
-from .const import CONF_ENDPOINT_ID, CONF_INSTANCE_ID
+from .const import (
+    CONF_ALL_ENDPOINTS,
+    CONF_ENDPOINT_ID,
+    CONF_ENDPOINT_IDS,
+    CONF_INSTANCE_ID,
+)
+
+
+def configured_endpoint_ids(data: Mapping[str, Any]) -> list[int] | None:
+    """Return the endpoint ids of an entry's data, None for all endpoints."""
+    if data.get(CONF_ALL_ENDPOINTS):
+        return None
+
+    if CONF_ENDPOINT_IDS in data:
+        return list(data[CONF_ENDPOINT_IDS])
+
+    return [data[CONF_ENDPOINT_ID]]
 
 
 class ConnectionConfig:
@@ -18,7 +37,8 @@ class ConnectionConfig:
         ssl: bool,
         verify_ssl: bool,
         instance_id: str,
-        endpoint_id: int,
+        endpoint_id: int | None,
+        endpoint_ids: list[int] | None = None,
     ) -> None:
         self.host = host
         self.port = port
@@ -27,14 +47,24 @@ class ConnectionConfig:
         self.verify_ssl = verify_ssl
         self.instance_id = instance_id
         self.endpoint_id = endpoint_id
+        # More than one endpoint, or an empty list for all of them
+        self.endpoint_ids = endpoint_ids
 
     def to_dict(self) -> dict:
-        return {
+        data = {
             CONF_HOST: self.host,
             CONF_PORT: self.port,
             CONF_API_KEY: self.api_key,
             CONF_SSL: self.ssl,
             CONF_VERIFY_SSL: self.verify_ssl,
-            CONF_ENDPOINT_ID: self.endpoint_id,
             CONF_INSTANCE_ID: self.instance_id,
         }
+
+        if self.endpoint_ids is None:
+            data[CONF_ENDPOINT_ID] = self.endpoint_id
+        elif self.endpoint_ids:
+            data[CONF_ENDPOINT_IDS] = self.endpoint_ids
+        else:
+            data[CONF_ALL_ENDPOINTS] = True
+
+        return data
@@ -2,12 +2,20 @@
 
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
+import time
 from typing import Any
 
 import voluptuous as vol
 
-from homeassistant.config_entries import ConfigFlow, ConfigFlowResult
+from homeassistant.config_entries import (
+    ConfigEntry,
+    ConfigFlow,
+    ConfigFlowResult,
+    OptionsFlow,
+)
 from homeassistant.const import (
     CONF_API_KEY,
     CONF_HOST,
@@ -15,19 +23,46 @@ from homeassistant.const import (
     CONF_SSL,
     CONF_VERIFY_SSL,
 )
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.data_entry_flow import section
-
-from .api import CannotConnect, Endpoint, InvalidAuth, PortainerAPI, SSLCertificateError
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.selector import TextSelector, TextSelectorConfig
+
+from .api import (
+    CannotConnect,
+    InvalidAuth,
+    PortainerAPI,
+    PortainerSystemStatus,
+    SSLCertificateError,
+    endpoint_list,
+)
 from .const import (
     CONNECTION_FAILED_ERROR_KEY,
     DOMAIN,
     INVALID_AUTH_ERROR_KEY,
     SSL_ERROR_KEY,
     TIMEOUT_ERROR_KEY,
-    CONF_ENDPOINT_ID,
+    CONF_ALL_ENDPOINTS,
+    CONF_ENDPOINT_IDS,
+    CONF_INSTANCE_ID,
+    CONF_COMPOSE_PROJECTS,
+    CONF_DOCKER_FILTERS,
+    CONF_EXCLUDE_NAMES,
+    CONF_INCLUDE_NAMES,
+    CONF_LABEL_SELECTORS,
+    CONF_LIVE_CONTAINERS,
+    CONF_MAX_POLL_INTERVAL,
+    CONF_SUMMARY_ONLY,
+    CONF_USE_EVENTS,
+    DEFAULT_MAX_POLL_INTERVAL,
+    INVALID_FILTERS_ERROR_KEY,
+    INVALID_LABELS_ERROR_KEY,
+    ENDPOINTS_CONFIGURED_ERROR_KEY,
+    NO_ENDPOINTS_ERROR_KEY,
 )
-from .config import ConnectionConfig
+from .config import ConnectionConfig, configured_endpoint_ids
+from .coordinator import async_find_hub_api, async_store_flow_endpoints
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -48,6 +83,37 @@ STEP_USER_DATA_SCHEMA = vol.Schema(
     }
 )
 
+OPTIONS_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_SUMMARY_ONLY, default=False): bool,
+        vol.Optional(CONF_USE_EVENTS, default=False): bool,
+        vol.Optional(CONF_LIVE_CONTAINERS, default=False): bool,
+        vol.Optional(CONF_DOCKER_FILTERS): str,
+        vol.Optional(
+            CONF_MAX_POLL_INTERVAL, default=DEFAULT_MAX_POLL_INTERVAL
+        ): vol.All(vol.Coerce(int), vol.Range(min=3, max=3600)),
+        vol.Optional(CONF_INCLUDE_NAMES): TextSelector(
+            TextSelectorConfig(multiple=True)
+        ),
+        vol.Optional(CONF_EXCLUDE_NAMES): TextSelector(
+            TextSelectorConfig(multiple=True)
+        ),
+        vol.Optional(CONF_LABEL_SELECTORS): TextSelector(
+            TextSelectorConfig(multiple=True)
+        ),
+        vol.Optional(CONF_COMPOSE_PROJECTS): TextSelector(
+            TextSelectorConfig(multiple=True)
+        ),
+    }
+)
+
+SELECTION_OPTIONS = (
+    CONF_INCLUDE_NAMES,
+    CONF_EXCLUDE_NAMES,
+    CONF_LABEL_SELECTORS,
+    CONF_COMPOSE_PROJECTS,
+)
+
 
 class PlaceholderHub:
     """Placeholder class to make tests pass.
@@ -64,58 +130,52 @@ class PlaceholderHub:
         return True
 
 
-async def load_endpoints(hass: HomeAssistant, data: dict[str, Any]) -> list[Endpoint]:
+async def validate_connection(
+    hass: HomeAssistant, data: dict[str, Any]
+) -> tuple[PortainerSystemStatus, list[dict[str, Any]]]:
     """Validate the user input allows us to connect and load the available endpoints.
 
-    Data has the keys from STEP_USER_DATA_SCHEMA with values provided by the user.
+    The instance's status and its endpoints are fetched concurrently, over
+    Home Assistant's pooled session which the entry setup reuses. Endpoints
+    are returned in compact form, see decode.py. If a hub already connects
+    the same way its client is used, sharing any request it has running.
     """
-
-    # If your PyPI package is not built with async, pass your methods
-    # to the executor:
-    # await hass.async_add_executor_job(
-    #     your_validate_func, data[CONF_USERNAME], data[CONF_PASSWORD]
-    # )
-
-    async with PortainerAPI(
+    connection = (
         data[CONF_HOST],
         data[CONF_PORT],
         data[CONF_API_KEY],
         data["ssl_config"][CONF_SSL],
         data["ssl_config"][CONF_VERIFY_SSL],
-        0,
-    ) as api:
-        res = await api.load_endpoints_list()
-        if not res:
-            raise InvalidAuth
+    )
 
-        return res
+    if (api := async_find_hub_api(hass, *connection)) is not None:
+        status, endpoints = await _fetch_status_and_endpoints(api)
+    else:
+        async with PortainerAPI(
+            *connection,
+            0,
+            async_get_clientsession(hass, data["ssl_config"][CONF_VERIFY_SSL]),
+        ) as api:
+            status, endpoints = await _fetch_status_and_endpoints(api)
 
+    if not endpoints:
+        raise InvalidAuth
 
-async def fetch_instance_id(hass: HomeAssistant, data: dict[str, Any]) -> str:
-    """Validate the user input allows us to connect and load the available endpoints.
-
-    Data has the keys from STEP_USER_DATA_SCHEMA with values provided by the user.
-    """
+    return status, endpoints
 
-    # If your PyPI package is not built with async, pass your methods
-    # to the executor:
-    # await hass.async_add_executor_job(
-    #     your_validate_func, data[CONF_USERNAME], data[CONF_PASSWORD]
-    # )
 
-    async with PortainerAPI(
-        data[CONF_HOST],
-        data[CONF_PORT],
-        data[CONF_API_KEY],
-        data["ssl_config"][CONF_SSL],
-        data["ssl_config"][CONF_VERIFY_SSL],
-        0,
-    ) as api:
-        res = await api.system_status()
-        if not res:
-            raise InvalidAuth
+async def _fetch_status_and_endpoints(
+    api: PortainerAPI,
+) -> tuple[PortainerSystemStatus, list[dict[str, Any]]]:
+    try:
+        async with asyncio.TaskGroup() as group:
+            status = group.create_task(api.system_status())
+            endpoints = group.create_task(api.load_endpoint_snapshots())
+    except ExceptionGroup as err:
+        # Both requests usually fail for the same reason.
+        raise err.exceptions[0] from None
 
-        return res.instance_id
+    return status.result(), endpoints.result()
 
 
 class PortainerConfigFlow(ConfigFlow, domain=DOMAIN):
@@ -124,10 +184,17 @@ class PortainerConfigFlow(ConfigFlow, domain=DOMAIN):
     VERSION = 1
     MINOR_VERSION = 0
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry: ConfigEntry) -> OptionsFlow:
+        return PortainerOptionsFlow()
+
     def __init__(self):
         self._endpoints = []
         self._instance_id = None
         self._connection = None
+        self._snapshots = []
+        self._fetched_at = 0.0
 
     async def async_step_user(
         self, user_input: dict[str, Any] | None = None
@@ -137,9 +204,12 @@ class PortainerConfigFlow(ConfigFlow, domain=DOMAIN):
 
         if user_input is not None:
             try:
-                self._endpoints = await load_endpoints(self.hass, user_input)
-
-                instance_id = await fetch_instance_id(self.hass, user_input)
+                status, self._snapshots = await validate_connection(
+                    self.hass, user_input
+                )
+                self._fetched_at = time.monotonic()
+                self._endpoints = endpoint_list(self._snapshots)
+                instance_id = status.instance_id
 
                 _LOGGER.info("Setting up instance ID %s", instance_id)
 
@@ -176,33 +246,133 @@ class PortainerConfigFlow(ConfigFlow, domain=DOMAIN):
     async def async_step_environment(
         self, user_input: dict[str, Any] | None = None
     ) -> ConfigFlowResult:
+        errors: dict[str, str] = {}
+        names = {str(e.id): e.name for e in self._endpoints}
+
         if user_input is not None:
-            self._connection.endpoint_id = user_input[CONF_ENDPOINT_ID]
+            selected = sorted(int(i) for i in user_input.get(CONF_ENDPOINT_IDS, []))
+            instance_id = self._connection.instance_id
+
+            if user_input.get(CONF_ALL_ENDPOINTS):
+                # Every environment, including ones added later on.
+                self._connection.endpoint_ids = []
+                unique_id = f"{instance_id}-all"
+                environments = "all environments"
+            elif len(selected) == 1:
+                self._connection.endpoint_id = selected[0]
+                unique_id = f"{instance_id}-e{selected[0]}"
+                environments = str(selected[0])
+            elif selected:
+                self._connection.endpoint_ids = selected
+                unique_id = f"{instance_id}-" + "-".join(f"e{i}" for i in selected)
+                environments = ", ".join(names[str(i)] for i in selected)
+            else:
+                errors["base"] = NO_ENDPOINTS_ERROR_KEY
 
-            await self.async_set_unique_id(
-                f"{self._connection.instance_id}-e{self._connection.endpoint_id}"
-            )
+            if not errors:
+                await self.async_set_unique_id(unique_id)
 
-            self._abort_if_unique_id_configured()
+                self._abort_if_unique_id_configured()
 
-            return self.async_create_entry(
-                title=f"Portainer ({self._connection.host}:{self._connection.port} {user_input[CONF_ENDPOINT_ID]})",
-                data=self._connection.to_dict(),
-            )
+                if self._endpoints_configured(
+                    None if user_input.get(CONF_ALL_ENDPOINTS) else selected
+                ):
+                    errors["base"] = ENDPOINTS_CONFIGURED_ERROR_KEY
+
+            if not errors:
+                # Saves the new entry's first refresh a round trip.
+                async_store_flow_endpoints(
+                    self.hass, instance_id, self._fetched_at, self._snapshots
+                )
+
+                return self.async_create_entry(
+                    title=f"Portainer ({self._connection.host}:{self._connection.port} {environments})",
+                    data=self._connection.to_dict(),
+                )
 
         return self.async_show_form(
             step_id="environment",
             last_step=True,
             data_schema=vol.Schema(
                 {
-                    vol.Required(CONF_ENDPOINT_ID): vol.In(
-                        {
-                            **{
-                                endpoint.id: f"{endpoint.name} ({endpoint.id})"
-                                for endpoint in self._endpoints
-                            },
-                        }
-                    )
+                    vol.Optional(CONF_ENDPOINT_IDS, default=[]): cv.multi_select(
+                        {i: f"{name} ({i})" for i, name in names.items()}
+                    ),
+                    vol.Optional(CONF_ALL_ENDPOINTS, default=False): bool,
                 }
             ),
+            errors=errors,
+        )
+
+    def _endpoints_configured(self, endpoint_ids: list[int] | None) -> bool:
+        """Whether another entry of the instance follows any of the endpoints.
+
+        None stands for every endpoint. Entities and devices are identified by
+        instance and endpoint, an endpoint followed by two entries would have
+        them registered twice.
+        """
+        for entry in self._async_current_entries(include_ignore=False):
+            if entry.data.get(CONF_INSTANCE_ID) != self._connection.instance_id:
+                continue
+
+            configured = configured_endpoint_ids(entry.data)
+
+            if (
+                configured is None
+                or endpoint_ids is None
+                or not set(configured).isdisjoint(endpoint_ids)
+            ):
+                return True
+
+        return False
+
+
+class PortainerOptionsFlow(OptionsFlow):
+    """Handle the options of a Portainer entry."""
+
+    async def async_step_init(
+        self, user_input: dict[str, Any] | None = None
+    ) -> ConfigFlowResult:
+        errors: dict[str, str] = {}
+
+        if user_input is not None:
+            for option in SELECTION_OPTIONS:
+                if option in user_input:
+                    user_input[option] = [
+                        v.strip() for v in user_input[option] if v.strip()
+                    ]
+
+            if not _valid_docker_filters(user_input.get(CONF_DOCKER_FILTERS)):
+                errors[CONF_DOCKER_FILTERS] = INVALID_FILTERS_ERROR_KEY
+            if not all(
+                label.partition("=")[0]
+                for label in user_input.get(CONF_LABEL_SELECTORS, [])
+            ):
+                errors[CONF_LABEL_SELECTORS] = INVALID_LABELS_ERROR_KEY
+
+            if not errors:
+                return self.async_create_entry(data=user_input)
+
+        return self.async_show_form(
+            step_id="init",
+            data_schema=self.add_suggested_values_to_schema(
+                OPTIONS_SCHEMA, user_input or self.config_entry.options
+            ),
+            errors=errors,
         )
+
+
+def _valid_docker_filters(filters: str | None) -> bool:
+    """Check filters are a JSON object of lists, as the docker API expects."""
+    if not filters:
+        return True
+
+    try:
+        parsed = json.loads(filters)
+    except ValueError:
+        return False
+
+    return isinstance(parsed, dict) and all(
+        isinstance(v, list) and all(isinstance(i, str) for i in v)
+        for v in parsed.values()
+    )
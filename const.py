@@ -1,5 +1,7 @@
 """Constants for the Portainer integration."""
 
+from datetime import timedelta
+
 DOMAIN = "portainer"
 
 # Errors
@@ -7,5 +9,79 @@ TIMEOUT_ERROR_KEY = "timeout"
 SSL_ERROR_KEY = "invalid_ssl"
 CONNECTION_FAILED_ERROR_KEY = "cannot_connect"
 INVALID_AUTH_ERROR_KEY = "invalid_auth"
+INVALID_FILTERS_ERROR_KEY = "invalid_filters"
+INVALID_LABELS_ERROR_KEY = "invalid_labels"
+NO_ENDPOINTS_ERROR_KEY = "no_endpoints"
+ENDPOINTS_CONFIGURED_ERROR_KEY = "endpoints_configured"
 CONF_ENDPOINT_ID = "endpoint_id"
+# Entries covering several environments store their ids instead, or
+# all_endpoints to follow every environment of the instance.
+CONF_ENDPOINT_IDS = "endpoint_ids"
+CONF_ALL_ENDPOINTS = "all_endpoints"
 CONF_INSTANCE_ID = "instance_id"
+
+# Options
+CONF_USE_EVENTS = "use_events"
+CONF_LIVE_CONTAINERS = "live_containers"
+CONF_DOCKER_FILTERS = "docker_filters"
+CONF_MAX_POLL_INTERVAL = "max_poll_interval"
+# Container selection, see selection.py
+CONF_INCLUDE_NAMES = "include_names"
+CONF_EXCLUDE_NAMES = "exclude_names"
+CONF_LABEL_SELECTORS = "label_selectors"
+CONF_COMPOSE_PROJECTS = "compose_projects"
+# Only endpoint level sensors from Portainer's snapshot counts, no container
+# or stack entities
+CONF_SUMMARY_ONLY = "summary_only"
+
+# Polling
+POLL_INTERVAL = timedelta(seconds=3)
+# After an action or a detected change we keep polling at POLL_INTERVAL for
+# the burst window, then grow the interval by the backoff factor per poll up
+# to the configured maximum (in seconds).
+POLL_BURST_WINDOW = timedelta(seconds=30)
+POLL_BACKOFF_FACTOR = 1.5
+POLL_JITTER = 0.1
+DEFAULT_MAX_POLL_INTERVAL = 30
+# Live endpoints are listed concurrently, a slow or offline one only delays a
+# refresh by this long.
+ENDPOINT_MAX_CONCURRENCY = 4
+ENDPOINT_FETCH_TIMEOUT = timedelta(seconds=10)
+
+# Endpoints fetched by the config flow stand in for the first refresh of the
+# new entry, unless the user took longer than this to finish the flow.
+FLOW_ENDPOINTS_MAX_AGE = timedelta(minutes=1)
+
+# The last good endpoints of each instance are saved, so that entities are
+# restored right away on startup while the first refresh runs in the
+# background. Saves are delayed so that a busy fleet writes at most once per
+# delay.
+SNAPSHOT_CACHE_VERSION = 1
+SNAPSHOT_CACHE_SAVE_DELAY = timedelta(minutes=1)
+SNAPSHOT_CACHE_MAX_AGE = timedelta(days=7)
+
+# When every endpoint of a hub is kept up to date by its event stream, polling
+# is only a safety net in case an event was missed.
+EVENTS_RESYNC_INTERVAL = timedelta(minutes=5)
+EVENTS_RECONNECT_MIN_DELAY = 1
+EVENTS_RECONNECT_MAX_DELAY = 60
+
+# How long a switch waits for its container to reach the requested state
+CONVERGE_TIMEOUT = timedelta(seconds=15)
+CONVERGE_POLL_INTERVAL = timedelta(milliseconds=500)
+
+# Portainer's stack list is reloaded when an unknown compose project shows up,
+# at most this often.
+STACKS_MAX_AGE = timedelta(minutes=5)
+# Stacks Portainer does not manage are started and stopped per container
+STACK_ACTION_MAX_CONCURRENCY = 4
+
+# Entities of a container that disappeared are kept, unavailable, for this
+# long so that a recreated container with the same name takes them over.
+CONTAINER_REMOVAL_DELAY = timedelta(minutes=10)
+
+# Container stats are sampled on their own, slower, cadence and only for
+# containers with enabled stats entities.
+STATS_INTERVAL = timedelta(seconds=30)
+STATS_ROUND_TIMEOUT = timedelta(seconds=20)
+STATS_MAX_CONCURRENCY = 4
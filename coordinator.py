@@ -1,5 +1,10 @@
+import asyncio
+from dataclasses import dataclass
 from datetime import timedelta
 import logging
+import random
+import time
+from collections.abc import Iterable, Mapping
 from typing import Any
 import json
 from homeassistant.config_entries import ConfigEntry
@@ -10,110 +15,1655 @@ from homeassistant.const import (
     CONF_SSL,
     CONF_VERIFY_SSL,
 )
-from homeassistant.core import DOMAIN, HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import ConfigEntryError, HomeAssistantError
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import (
     CoordinatorEntity,
     DataUpdateCoordinator,
     UpdateFailed,
 )
+from homeassistant.util import dt as dt_util
 
 from .api import (
     CannotConnect,
+    CircuitOpen,
     InvalidAuth,
+    NotFound,
     PortainerAPI,
     SSLCertificateError,
+    ContainerState,
     PortainerContainer,
+    PortainerStack,
+    endpoint_containers,
 )
+from .config import configured_endpoint_ids
+from .decode import ContainerFilter
 from .const import (
     CONNECTION_FAILED_ERROR_KEY,
     INVALID_AUTH_ERROR_KEY,
     SSL_ERROR_KEY,
     TIMEOUT_ERROR_KEY,
     CONF_ENDPOINT_ID,
+    CONF_INSTANCE_ID,
+    CONF_DOCKER_FILTERS,
+    CONF_LIVE_CONTAINERS,
+    CONF_MAX_POLL_INTERVAL,
+    CONF_SUMMARY_ONLY,
+    CONF_USE_EVENTS,
+    CONTAINER_REMOVAL_DELAY,
+    CONVERGE_POLL_INTERVAL,
+    CONVERGE_TIMEOUT,
+    DEFAULT_MAX_POLL_INTERVAL,
+    DOMAIN,
+    ENDPOINT_FETCH_TIMEOUT,
+    ENDPOINT_MAX_CONCURRENCY,
+    EVENTS_RECONNECT_MAX_DELAY,
+    EVENTS_RECONNECT_MIN_DELAY,
+    EVENTS_RESYNC_INTERVAL,
+    FLOW_ENDPOINTS_MAX_AGE,
+    POLL_BACKOFF_FACTOR,
+    POLL_BURST_WINDOW,
+    POLL_INTERVAL,
+    POLL_JITTER,
+    SNAPSHOT_CACHE_MAX_AGE,
+    SNAPSHOT_CACHE_SAVE_DELAY,
+    SNAPSHOT_CACHE_VERSION,
+    STACK_ACTION_MAX_CONCURRENCY,
+    STACKS_MAX_AGE,
 )
+from .resilience import SingleFlight
+from .selection import COMPOSE_PROJECT_LABEL, ContainerSelector
+from .stacks import StackIndex, StackKey, StackState
+
+# Docker container events which are applied to the hub's data, and the state
+# the container is in afterwards. Other subscribed events trigger a resync.
+EVENT_STATES = {
+    "start": "running",
+    "unpause": "running",
+    "pause": "paused",
+    "stop": "exited",
+    "die": "exited",
+}
+EVENT_FILTERS = {
+    "type": ["container"],
+    "event": [*EVENT_STATES, "create", "destroy", "rename"],
+}
 
 _LOGGER = logging.getLogger(__name__)
 
+# Instance id -> (when fetched, compact endpoints) from a config flow
+DATA_FLOW_ENDPOINTS = f"{DOMAIN}_flow_endpoints"
+
+# Endpoint id and container name, which identify a container's entities
+type ContainerKey = tuple[int, str]
+
+
+def snapshot_store(hass: HomeAssistant, instance_id: str) -> Store:
+    """The store of an instance's last good endpoints, see PortainerHub."""
+    return Store(
+        hass,
+        SNAPSHOT_CACHE_VERSION,
+        f"{DOMAIN}.{instance_id}",
+        atomic_writes=True,
+    )
 
-class PortainerDataCoordinator(DataUpdateCoordinator):
-    data: dict[str, any]
+
+@dataclass
+class DispatchStats:
+    updates: int = 0
+    containers_changed: int = 0
+    listeners_notified: int = 0
+    listeners_skipped: int = 0
+    last_changed: int = 0
+    # Time spent notifying listeners, in milliseconds
+    last_duration: float = 0.0
+    total_duration: float = 0.0
+
+
+class PortainerHub(DataUpdateCoordinator):
+    """Polls a Portainer instance once per tick on behalf of every config entry
+    that is configured against it."""
+
+    data: dict[int, dict[str, any]]
 
     def __init__(self, hass: HomeAssistant, config_entry: ConfigEntry) -> None:
-        """Initialize coordinator."""
+        """Initialize the hub."""
+
+        self.instance_id = config_entry.data[CONF_INSTANCE_ID]
 
         super().__init__(
             hass,
             _LOGGER,
-            name=f"{DOMAIN} ({config_entry.unique_id})",
-            update_interval=timedelta(seconds=3),
-            # Set always_update to `False` if the data returned from the
-            # api can be compared via `__eq__` to avoid duplicate updates
-            # being dispatched to listeners
+            # The hub outlives any single config entry, so it must not be
+            # bound to the entry that happened to create it.
+            config_entry=None,
+            name=f"{DOMAIN} hub ({self.instance_id})",
+            update_interval=POLL_INTERVAL,
             always_update=True,
         )
 
-        self.host = config_entry.data[CONF_HOST]
-        self.port = config_entry.data[CONF_PORT]
-        self.api_key = config_entry.data[CONF_API_KEY]
-        self.ssl = config_entry.data[CONF_SSL]
-        self.verify_ssl = config_entry.data[CONF_VERIFY_SSL]
-        self.environment = config_entry.data[CONF_ENDPOINT_ID]
-
         self.api = PortainerAPI(
-            host=self.host,
-            port=self.port,
-            api_key=self.api_key,
-            ssl=self.ssl,
-            verify_ssl=self.verify_ssl,
-            environment=self.environment,
+            host=config_entry.data[CONF_HOST],
+            port=config_entry.data[CONF_PORT],
+            api_key=config_entry.data[CONF_API_KEY],
+            ssl=config_entry.data[CONF_SSL],
+            verify_ssl=config_entry.data[CONF_VERIFY_SSL],
+            environment=config_entry.data.get(CONF_ENDPOINT_ID, 0),
+            # Home Assistant's pooled keep-alive session, which also caches DNS
+            # lookups and the SSL context.
+            session=async_get_clientsession(hass, config_entry.data[CONF_VERIFY_SSL]),
         )
 
-    async def _async_update_data(self):
+        # Config entry id -> endpoint ids
+        self._endpoints: dict[str, set[int]] = {}
+        # Config entry id -> entry options
+        self._options: dict[str, Mapping[str, Any]] = {}
+        # Config entry id -> its container selector, None to follow all
+        self._selectors: dict[str, ContainerSelector | None] = {}
+        # Endpoint id -> event stream task
+        self._event_tasks: dict[int, asyncio.Task] = {}
+        # Endpoints whose event stream is currently connected
+        self._events_connected: set[int] = set()
+        # (endpoint id, container id) -> a record applied to a snapshot
+        # endpoint, None once removed, and when, kept until Portainer takes a
+        # newer snapshot
+        self._applied: dict[
+            tuple[int, str], tuple[PortainerContainer | None, float]
+        ] = {}
+        # Endpoints whose last fetch failed, their previous data is kept
+        self.failed_endpoints: set[int] = set()
+        # Compact endpoints handed over by the config flow -> when fetched
+        self._preloaded: dict[int, dict[str, any]] = {}
+        self._preloaded_at = 0.0
+        # Compose stacks managed by Portainer, on every endpoint
+        self.stacks: dict[StackKey, PortainerStack] = {}
+        self.stacks_version = 0
+        self._stacks_at: float | None = None
+        self._stacks_lock = asyncio.Lock()
+        # The last good endpoints and stacks, saved for the next startup
+        self._store = snapshot_store(hass, self.instance_id)
+        self._cache_loaded = False
+        self._cache_save_pending = False
+        # Whether the data is still the one restored from the store
+        self.restored = False
+        # Refreshes requested while one is running share it
+        self._refreshes = SingleFlight(self.api.metrics.record_coalesced_refresh)
+
+        # Adaptive polling: poll fast until the burst window after the last
+        # activity ends, then back off towards the configured ceiling.
+        self._poll_seconds = POLL_INTERVAL.total_seconds()
+        self._burst_until = time.monotonic() + POLL_BURST_WINDOW.total_seconds()
+
+    def preload(self, fetched_at: float, endpoints: list[dict[str, any]]) -> None:
+        """Use endpoints fetched elsewhere instead of requesting them again."""
+        self._preloaded = {e["Id"]: e for e in endpoints}
+        self._preloaded_at = fetched_at
+
+    def preloaded_endpoint_ids(self) -> list[int] | None:
+        if not self._preloaded_fresh():
+            return None
+
+        return sorted(self._preloaded)
+
+    def _preloaded_fresh(self) -> bool:
+        age = time.monotonic() - self._preloaded_at
+
+        return bool(self._preloaded) and age < FLOW_ENDPOINTS_MAX_AGE.total_seconds()
+
+    def _take_preloaded(self) -> dict[int, dict[str, any]]:
+        preloaded = self._preloaded if self._preloaded_fresh() else {}
+        self._preloaded = {}
+
+        return preloaded
+
+    async def async_load_cache(self) -> None:
+        """Restore the endpoints and stacks saved by a previous run.
+
+        Only done once, and only while the hub has no data of its own. The
+        restored data stands in for the first refresh, it is replaced by the
+        next successful one.
+        """
+        if self._cache_loaded or self.data is not None:
+            return
+
+        self._cache_loaded = True
+        cached = await self._store.async_load()
+
+        if cached is None:
+            return
+
+        saved_at = dt_util.parse_datetime(cached.get("saved_at", ""))
+
+        if saved_at is None or dt_util.utcnow() - saved_at > SNAPSHOT_CACHE_MAX_AGE:
+            _LOGGER.debug("Ignoring saved endpoints from %s", saved_at)
+            return
+
         try:
-            data = list(
-                filter(
-                    lambda e: e["Id"] == self.environment,
-                    await self.api.load_endpoints(),
-                )
-            )[0]
-        except SSLCertificateError as err:
-            _LOGGER.error("SSL Certificate Failed")
-            # errors["base"] = SSL_ERROR_KEY
-            raise UpdateFailed("") from err
-        except TimeoutError as err:
-            _LOGGER.error("Server Connection Timed Out")
-            # errors["base"] = TIMEOUT_ERROR_KEY
-        except CannotConnect:
-            _LOGGER.error("Failed to connect to the server")
-            # errors["base"] = CONNECTION_FAILED_ERROR_KEY
-        except InvalidAuth:
-            _LOGGER.error("Server authentication was invalid")
-            # errors["base"] = INVALID_AUTH_ERROR_KEY
-        except Exception as err:
-            _LOGGER.error(f"Unexpected exception: {err}")
-            # errors["base"] = "unknown"
-            raise UpdateFailed(
-                f"Error communicating with Portainer API: {err}"
-            ) from err
+            data = {
+                endpoint["Id"]: {
+                    **endpoint,
+                    "Containers": [
+                        PortainerContainer(c) for c in endpoint["Containers"]
+                    ],
+                }
+                for endpoint in cached["endpoints"]
+            }
+            stacks = [PortainerStack(s) for s in cached["stacks"]]
+        except (KeyError, TypeError, ValueError) as err:
+            _LOGGER.warning("Ignoring malformed saved endpoints: %s", err)
+            return
+
+        _LOGGER.debug("Restored %d endpoints saved at %s", len(data), saved_at)
+
+        self.data = data
+        self.restored = True
+        self.stacks = {StackKey(s.endpoint_id, s.name): s for s in stacks}
+        self.stacks_version += 1
+
+    def restored_endpoint_ids(self) -> list[int] | None:
+        """The endpoints of the restored data, None once it was refreshed."""
+        if not self.restored:
+            return None
+
+        return sorted(self.data)
+
+    @callback
+    def async_schedule_cache_save(self) -> None:
+        """Save the data after SNAPSHOT_CACHE_SAVE_DELAY.
+
+        Unlike Store.async_delay_save() on its own, further changes do not
+        postpone a pending save, so a fleet that keeps changing is still
+        saved once per delay.
+        """
+        # Restored data is already saved.
+        if self._cache_save_pending or self.restored:
+            return
+
+        self._cache_save_pending = True
+        self._store.async_delay_save(
+            self._cache_data, SNAPSHOT_CACHE_SAVE_DELAY.total_seconds()
+        )
+
+    @callback
+    def _cache_data(self) -> dict[str, Any]:
+        self._cache_save_pending = False
+
+        return {
+            "saved_at": dt_util.utcnow().isoformat(),
+            "endpoints": [
+                {
+                    **endpoint,
+                    "Containers": [c.as_dict() for c in endpoint_containers(endpoint)],
+                }
+                for endpoint in (self.data or {}).values()
+            ],
+            "stacks": [s.as_dict() for s in self.stacks.values()],
+        }
+
+    async def async_flush_cache(self) -> None:
+        """Write a pending save now, e.g. before the hub is closed."""
+        if self._cache_save_pending:
+            await self._store.async_save(self._cache_data())
+
+    def register(
+        self, entry_id: str, endpoint_ids: list[int], options: Mapping[str, Any]
+    ) -> None:
+        self._endpoints[entry_id] = set(endpoint_ids)
+        self._options[entry_id] = options
+        self._selectors[entry_id] = ContainerSelector.from_options(options)
+        self._update_event_tasks()
+
+    def unregister(self, entry_id: str) -> None:
+        self._endpoints.pop(entry_id, None)
+        self._options.pop(entry_id, None)
+        self._selectors.pop(entry_id, None)
+        self._update_event_tasks()
+
+    def _endpoints_with(self, option: str) -> set[int]:
+        # Entries in summary mode need the snapshot counts and no containers,
+        # their container options do not apply.
+        return {
+            endpoint_id
+            for entry_id, options in self._options.items()
+            if options.get(option) and not options.get(CONF_SUMMARY_ONLY)
+            for endpoint_id in self._endpoints[entry_id]
+        }
+
+    def _docker_filters(self, endpoint_id: int) -> dict[str, list[str]] | None:
+        """The filters the daemon lists a live endpoint's containers with.
+
+        The listing is shared by every entry following the endpoint, their
+        docker filters are only sent if they all have the same ones. Otherwise
+        the endpoint is listed without them and each entry only narrows it by
+        its selection.
+        """
+        wanted = set()
+
+        for entry_id, options in self._options.items():
+            if endpoint_id in self._endpoints[entry_id] and not options.get(
+                CONF_SUMMARY_ONLY
+            ):
+                # Docker filters are only used with live listing.
+                live = options.get(CONF_LIVE_CONTAINERS)
+                wanted.add(options.get(CONF_DOCKER_FILTERS) if live else None)
+
+        wanted.discard("")
+        filters = None
+
+        if len(wanted) == 1 and (raw := next(iter(wanted))):
+            filters = json.loads(raw)
+
+        selectors = self._endpoint_selectors(endpoint_id)
+
+        # The daemon can only narrow the listing for a single selection.
+        if not selectors or len(set(selectors)) > 1:
+            return filters
+
+        filters = filters or {}
+
+        for name, values in selectors[0].docker_filters().items():
+            # Docker ORs name filters, adding ours would widen the user's.
+            if name == "name" and name in filters:
+                continue
+
+            filters[name] = filters.get(name, []) + values
+
+        return filters
+
+    def _endpoint_selectors(self, endpoint_id: int) -> list[ContainerSelector] | None:
+        """Selectors of the entries following an endpoint, None if one takes all."""
+        selectors = []
+
+        for entry_id, endpoint_ids in self._endpoints.items():
+            if endpoint_id in endpoint_ids:
+                if (selector := self._selectors.get(entry_id)) is None:
+                    return None
+
+                selectors.append(selector)
+
+        return selectors or None
+
+    def _container_filter(self, endpoint_ids: list[int]) -> ContainerFilter | None:
+        """Skip containers that no entry following their endpoint selects."""
+        selectors = {
+            endpoint_id: selectors
+            for endpoint_id in endpoint_ids
+            if (selectors := self._endpoint_selectors(endpoint_id)) is not None
+        }
+
+        if not selectors:
+            return None
+
+        def accept(endpoint_id: int | None, container: dict[str, any]) -> bool:
+            if endpoint_id not in selectors:
+                return True
+
+            return any(s.matches_docker(container) for s in selectors[endpoint_id])
+
+        return accept
+
+    def _update_event_tasks(self) -> None:
+        """Start or stop event streams and pick the matching poll interval."""
+        wanted = self._endpoints_with(CONF_USE_EVENTS)
+
+        for endpoint_id in self._event_tasks.keys() - wanted:
+            self._event_tasks.pop(endpoint_id).cancel()
+
+        for endpoint_id in wanted - self._event_tasks.keys():
+            self._event_tasks[endpoint_id] = self.hass.async_create_background_task(
+                self._async_watch_events(endpoint_id),
+                f"{DOMAIN} events ({self.instance_id} e{endpoint_id})",
+            )
+
+    def _max_poll_seconds(self) -> float:
+        # The most demanding entry sets the ceiling for the whole hub.
+        return min(
+            (
+                options.get(CONF_MAX_POLL_INTERVAL, DEFAULT_MAX_POLL_INTERVAL)
+                for options in self._options.values()
+            ),
+            default=DEFAULT_MAX_POLL_INTERVAL,
+        )
+
+    @callback
+    def note_activity(self) -> None:
+        """Poll fast for a while, e.g. after an action or a detected change."""
+        self._burst_until = time.monotonic() + POLL_BURST_WINDOW.total_seconds()
+
+        if self._poll_seconds > POLL_INTERVAL.total_seconds():
+            self._poll_seconds = POLL_INTERVAL.total_seconds()
+
+            # Bring forward a refresh that was scheduled with the backed off
+            # interval.
+            if self._unsub_refresh:
+                self._schedule_refresh()
+
+    def _events_only(self) -> bool:
+        """Whether a connected event stream keeps every endpoint up to date."""
+        endpoint_ids = self.endpoint_ids()
+
+        return bool(endpoint_ids) and self._events_connected.issuperset(endpoint_ids)
+
+    @callback
+    def _set_events_connected(self, endpoint_id: int, connected: bool) -> None:
+        events_only = self._events_only()
+
+        if connected:
+            self._events_connected.add(endpoint_id)
         else:
-            _LOGGER.debug(json.dumps(data))
-            return data
+            self._events_connected.discard(endpoint_id)
 
-    def get_containers(self) -> list[PortainerContainer]:
-        return [
-            PortainerContainer(c)
-            for c in self.data["Snapshots"][0]["DockerSnapshotRaw"]["Containers"]
-        ]
+        # A stream that drops must not leave the hub waiting for a resync.
+        if self._events_only() != events_only and self._unsub_refresh:
+            self._schedule_refresh()
+
+    def _next_interval(self) -> timedelta:
+        if self._events_only():
+            return EVENTS_RESYNC_INTERVAL
 
-    def get_container(self, container_id: str) -> PortainerContainer:
-        for container in self.get_containers():
+        if time.monotonic() < self._burst_until:
+            self._poll_seconds = POLL_INTERVAL.total_seconds()
+        else:
+            self._poll_seconds = min(
+                self._poll_seconds * POLL_BACKOFF_FACTOR, self._max_poll_seconds()
+            )
+
+        # Jitter keeps hubs for different instances from polling in lockstep.
+        return timedelta(
+            seconds=self._poll_seconds
+            * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+        )
+
+    @callback
+    def _schedule_refresh(self) -> None:
+        self.update_interval = self._next_interval()
+        super()._schedule_refresh()
+
+    async def _async_watch_events(self, endpoint_id: int) -> None:
+        """Follow an endpoint's event stream, reconnecting when it drops.
+
+        The endpoint is only left to its events while the stream is
+        connected, otherwise it is polled like any other.
+        """
+        delay = EVENTS_RECONNECT_MIN_DELAY
+
+        while True:
+            try:
+                async with self.api.event_stream(endpoint_id, EVENT_FILTERS) as events:
+                    delay = EVENTS_RECONNECT_MIN_DELAY
+                    self._set_events_connected(endpoint_id, True)
+
+                    # Anything may have happened while we were not listening.
+                    await self.async_request_refresh()
+
+                    async for event in events:
+                        await self._async_apply_event(endpoint_id, event)
+
+                _LOGGER.debug("Event stream of endpoint %s closed", endpoint_id)
+            except (CannotConnect, InvalidAuth, SSLCertificateError) as err:
+                _LOGGER.warning(
+                    "Event stream of endpoint %s failed (%s), reconnecting in %ds",
+                    endpoint_id,
+                    type(err).__name__,
+                    delay,
+                )
+            except Exception:
+                # E.g. a line too long for the stream reader, the stream must
+                # not stop for good because of it.
+                _LOGGER.exception(
+                    "Unexpected error in the event stream of endpoint %s, "
+                    "reconnecting in %ds",
+                    endpoint_id,
+                    delay,
+                )
+            finally:
+                self._set_events_connected(endpoint_id, False)
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, EVENTS_RECONNECT_MAX_DELAY)
+
+    async def _async_apply_event(self, endpoint_id: int, event: dict[str, any]) -> None:
+        action = event.get("Action")
+        container_id = event.get("Actor", {}).get("ID")
+
+        _LOGGER.debug(
+            "Container %s event on endpoint %s: %s", action, endpoint_id, container_id
+        )
+
+        if action == "destroy":
+            self.remove_container(endpoint_id, container_id)
+            return
+
+        attributes = event.get("Actor", {}).get("Attributes", {})
+
+        if action in EVENT_STATES:
+            if self.set_container_state(
+                endpoint_id,
+                container_id,
+                EVENT_STATES[action],
+                attributes.get("exitCode", 0),
+            ):
+                return
+
+        # Containers no entry follows are not listed, so they are always
+        # unknown. Their events carry the name and labels to tell.
+        if self._find_container(endpoint_id, container_id) is None and (
+            selectors := self._endpoint_selectors(endpoint_id)
+        ):
+            if not any(
+                s.matches(attributes.get("name", ""), attributes) for s in selectors
+            ):
+                return
+
+        # Created, renamed or unknown containers need a full listing.
+        await self.async_request_refresh()
+
+    def _find_container(
+        self, endpoint_id: int, container_id: str | None
+    ) -> tuple[list[dict[str, any]], int] | None:
+        endpoint = self.data.get(endpoint_id) if self.data else None
+
+        if endpoint is None or not container_id:
+            return None
+
+        containers = endpoint_containers(endpoint)
+
+        for i, container in enumerate(containers):
             if container.id() == container_id:
-                return container
+                return containers, i
 
         return None
 
+    @callback
+    def set_container_state(
+        self, endpoint_id: int, container_id: str, state: str, exit_code=0
+    ) -> bool:
+        """Apply a known container state to the hub's data and notify entries.
+
+        Returns False if the container is not in the current data.
+        """
+        found = self._find_container(endpoint_id, container_id)
+
+        if found is None:
+            return False
+
+        containers, i = found
+        status = "Paused" if state == "paused" else "Up"
+
+        if state == "exited":
+            status = f"Exited ({exit_code})"
+
+        # Replace rather than mutate the container so that entities holding
+        # the previous record are unaffected until they are notified.
+        containers[i] = containers[i].with_state(ContainerState(state), status)
+        self._hold_applied(endpoint_id, {container_id: containers[i]})
+        self.async_update_listeners()
+
+        return True
+
+    @callback
+    def apply_containers(
+        self, endpoint_id: int, containers: list[PortainerContainer]
+    ) -> bool:
+        """Replace containers of the hub's data with fresher records.
+
+        Returns False, changing nothing, if any of them is not in the data.
+        """
+        found = [self._find_container(endpoint_id, c.id()) for c in containers]
+
+        if None in found:
+            return False
+
+        for (records, i), container in zip(found, containers):
+            records[i] = container
+
+        self._hold_applied(endpoint_id, {c.id(): c for c in containers})
+        self.async_update_listeners()
+
+        return True
+
+    def _hold_applied(
+        self, endpoint_id: int, records: dict[str, PortainerContainer | None]
+    ) -> None:
+        # Portainer snapshots endpoints every few minutes, until it takes a
+        # newer one its snapshot still has the containers as they were.
+        if endpoint_id in self._endpoints_with(CONF_LIVE_CONTAINERS):
+            return
+
+        now = time.time()
+
+        # Container id -> its record, None for a removed container
+        for container_id, container in records.items():
+            self._applied[(endpoint_id, container_id)] = (container, now)
+
+    def _apply_held(self, data: dict[int, dict[str, any]]) -> None:
+        """Keep applied records over snapshots taken before they were applied.
+
+        Removed containers are dropped from those snapshots.
+        """
+        for key, (container, applied_at) in list(self._applied.items()):
+            endpoint_id, container_id = key
+            endpoint = data.get(endpoint_id)
+            taken_at = endpoint and endpoint.get("Snapshot", {}).get("Time")
+
+            if not taken_at or taken_at >= applied_at:
+                del self._applied[key]
+                continue
+
+            containers = endpoint_containers(endpoint)
+
+            for i, record in enumerate(containers):
+                if record.id() == container_id:
+                    if container is None:
+                        del containers[i]
+                    else:
+                        containers[i] = container
+                    break
+
+    @callback
+    def remove_container(self, endpoint_id: int, container_id: str) -> None:
+        found = self._find_container(endpoint_id, container_id)
+
+        if found is not None:
+            containers, i = found
+            del containers[i]
+            self._hold_applied(endpoint_id, {container_id: None})
+            self.async_update_listeners()
+
+    async def async_refresh_stacks(self, force: bool = False) -> None:
+        """Reload the stacks Portainer manages, unless they are recent enough.
+
+        Stacks only add Portainer's one request start and stop to the
+        grouping, so failing to list them is not an error.
+        """
+        async with self._stacks_lock:
+            if (
+                not force
+                and self._stacks_at is not None
+                and time.monotonic() - self._stacks_at < STACKS_MAX_AGE.total_seconds()
+            ):
+                return
+
+            self._stacks_at = time.monotonic()
+
+            try:
+                stacks = await self.api.load_stacks()
+            except (CannotConnect, InvalidAuth, SSLCertificateError) as err:
+                _LOGGER.debug("Failed to load stacks: %s", type(err).__name__)
+                return
+
+            self.set_stacks(
+                {StackKey(s.endpoint_id, s.name): s for s in stacks}, replace=True
+            )
+
+    @callback
+    def set_stacks(
+        self, stacks: dict[StackKey, PortainerStack], replace: bool = False
+    ) -> None:
+        """Update the known stacks, notifying entries if any of them changed."""
+        updated = stacks if replace else self.stacks | stacks
+
+        if updated == self.stacks:
+            return
+
+        self.stacks = updated
+        self.stacks_version += 1
+        self.async_schedule_cache_save()
+        self.async_update_listeners()
+
+    async def async_shutdown(self) -> None:
+        for task in self._event_tasks.values():
+            task.cancel()
+
+        self._event_tasks.clear()
+        self._events_connected.clear()
+        self._applied.clear()
+
+        await super().async_shutdown()
+
+    def has_entries(self) -> bool:
+        return bool(self._endpoints)
+
+    def endpoint_ids(self) -> list[int]:
+        return sorted(set().union(*self._endpoints.values()))
+
+    async def async_refresh(self) -> None:
+        """Refresh the data, sharing a refresh that is already running.
+
+        A running refresh is only shared by callers that asked for one before
+        any action completed since it started, so that callers which changed
+        something always get data that reflects it.
+        """
+        await self._refreshes.run(self.api.actions, super().async_refresh)
+
+    async def _async_update_data(self):
+        start = time.perf_counter()
+
+        try:
+            data = await self._async_fetch_endpoints()
+        finally:
+            self.api.metrics.record_tick(time.perf_counter() - start)
+
+        self.restored = False
+
+        return data
+
+    async def _async_fetch_endpoints(self):
+        """Fetch every registered endpoint, isolating their failures.
+
+        Live endpoints are listed concurrently, at most
+        ENDPOINT_MAX_CONCURRENCY at a time and each within
+        ENDPOINT_FETCH_TIMEOUT, while snapshots of the others are read from
+        Portainer in a single request. An endpoint that fails keeps its
+        previous data and is listed in failed_endpoints. Only when every
+        fetch fails does the refresh fail.
+        """
+        endpoint_ids = self.endpoint_ids()
+
+        if not endpoint_ids:
+            self.failed_endpoints = set()
+            return {}
+
+        live = self._endpoints_with(CONF_LIVE_CONTAINERS)
+        # Snapshots the config flow just fetched are only taken once, and
+        # only for endpoints the hub has no fetched data for yet: they may be
+        # older than that data, which events and actions keep current.
+        current = self.data if self.data and not self.restored else {}
+        preloaded = {
+            endpoint_id: endpoint
+            for endpoint_id, endpoint in self._take_preloaded().items()
+            if endpoint_id in endpoint_ids
+            and endpoint_id not in live
+            and endpoint_id not in current
+        }
+        snapshot_ids = [e for e in endpoint_ids if e not in live | preloaded.keys()]
+        semaphore = asyncio.Semaphore(ENDPOINT_MAX_CONCURRENCY)
+
+        groups = [[e] for e in sorted(live)]
+        fetches = [self._async_fetch_live(e, semaphore) for e in sorted(live)]
+
+        if snapshot_ids:
+            groups.append(snapshot_ids)
+            fetches.append(
+                self.api.load_endpoint_snapshots(
+                    snapshot_ids, self._container_filter(snapshot_ids)
+                )
+            )
+
+        results = await asyncio.gather(*fetches, return_exceptions=True)
+
+        data = dict(preloaded)
+        failed = {}
+
+        for group, result in zip(groups, results):
+            if isinstance(result, BaseException):
+                failed.update(dict.fromkeys(group, result))
+                continue
+
+            data.update({e["Id"]: e for e in result})
+
+            # Portainer leaves out environments which were deleted.
+            for endpoint_id in group:
+                if endpoint_id not in data:
+                    failed[endpoint_id] = NotFound()
+
+        if failed and not data:
+            err = next(iter(failed.values()))
+            raise _update_failed(err) from err
+
+        for endpoint_id, err in failed.items():
+            _LOGGER.debug(
+                "Failed to fetch endpoint %s: %s", endpoint_id, type(err).__name__
+            )
+
+            if self.data and endpoint_id in self.data:
+                data[endpoint_id] = self.data[endpoint_id]
+
+        self.failed_endpoints = set(failed)
+        self._apply_held(data)
+
+        return data
+
+    async def _async_fetch_live(
+        self, endpoint_id: int, semaphore: asyncio.Semaphore
+    ) -> list[dict[str, any]]:
+        async with (
+            semaphore,
+            asyncio.timeout(ENDPOINT_FETCH_TIMEOUT.total_seconds()),
+        ):
+            containers = await self.api.list_containers(
+                endpoint_id,
+                self._docker_filters(endpoint_id),
+                self._container_filter([endpoint_id]),
+            )
+
+        return [{"Id": endpoint_id, "Containers": containers}]
+
+
+def _update_failed(err: BaseException) -> UpdateFailed:
+    # Failures raise UpdateFailed so the last known good data is kept, the
+    # coordinator logs the first failure and the recovery itself.
+    if isinstance(err, SSLCertificateError):
+        return UpdateFailed("SSL certificate verification failed")
+    if isinstance(err, CircuitOpen):
+        return UpdateFailed("Portainer is unreachable, requests are suspended")
+    if isinstance(err, NotFound):
+        return UpdateFailed("Portainer environment not found")
+    if isinstance(err, (TimeoutError, CannotConnect)):
+        return UpdateFailed("Failed to connect to Portainer")
+    if isinstance(err, InvalidAuth):
+        return UpdateFailed("Portainer authentication was invalid")
+
+    _LOGGER.error("Unexpected exception: %s", err, exc_info=err)
+    return UpdateFailed(f"Error communicating with Portainer API: {err}")
+
+
+@callback
+def async_get_hub(hass: HomeAssistant, config_entry: ConfigEntry) -> PortainerHub:
+    """Return the hub for the entry's Portainer instance, creating it if needed.
+
+    Entries of an instance share its hub and so its connection, an entry that
+    connects with other settings than the hub's is rejected rather than
+    silently using them.
+    """
+    hubs: dict[str, PortainerHub] = hass.data.setdefault(DOMAIN, {})
+    instance_id = config_entry.data[CONF_INSTANCE_ID]
+
+    if instance_id not in hubs:
+        hubs[instance_id] = PortainerHub(hass, config_entry)
+
+    hub = hubs[instance_id]
+
+    if not hub.api.connects_to(
+        config_entry.data[CONF_HOST],
+        config_entry.data[CONF_PORT],
+        config_entry.data[CONF_API_KEY],
+        config_entry.data[CONF_SSL],
+        config_entry.data[CONF_VERIFY_SSL],
+    ):
+        raise ConfigEntryError(
+            "Another entry already connects to this Portainer instance with "
+            "other settings, entries of an instance must use the same host, "
+            "port, API key and SSL settings"
+        )
+
+    if validated := hass.data.get(DATA_FLOW_ENDPOINTS, {}).pop(instance_id, None):
+        hub.preload(*validated)
+
+    return hub
+
+
+@callback
+def async_find_hub_api(
+    hass: HomeAssistant,
+    host: str,
+    port: str,
+    api_key: str,
+    ssl: bool,
+    verify_ssl: bool,
+) -> PortainerAPI | None:
+    """Return the API client of a running hub connecting with these settings."""
+    hubs: dict[str, PortainerHub] = hass.data.get(DOMAIN, {})
+
+    for hub in hubs.values():
+        if hub.api.connects_to(host, port, api_key, ssl, verify_ssl):
+            return hub.api
+
+    return None
+
+
+@callback
+def async_store_flow_endpoints(
+    hass: HomeAssistant,
+    instance_id: str,
+    fetched_at: float,
+    endpoints: list[dict[str, any]],
+) -> None:
+    """Hand the endpoints a config flow fetched over to the setup of its entry."""
+    hass.data.setdefault(DATA_FLOW_ENDPOINTS, {})[instance_id] = (
+        fetched_at,
+        endpoints,
+    )
+
+
+async def async_release_hub(
+    hass: HomeAssistant, coordinator: "PortainerDataCoordinator"
+):
+    """Detach an entry's coordinator from its hub, closing the hub once unused."""
+    hub = coordinator.hub
+    coordinator.detach()
+
+    if hub.has_entries():
+        return
+
+    hass.data[DOMAIN].pop(hub.instance_id, None)
+    await hub.async_flush_cache()
+    await hub.async_shutdown()
+    await hub.api.close()
+
+
+class PortainerDataCoordinator(DataUpdateCoordinator):
+    data: dict[str, any]
+
+    def __init__(
+        self, hass: HomeAssistant, config_entry: ConfigEntry, hub: PortainerHub
+    ) -> None:
+        """Initialize coordinator."""
+
+        super().__init__(
+            hass,
+            _LOGGER,
+            config_entry=config_entry,
+            name=f"{DOMAIN} ({config_entry.unique_id})",
+            # Polling is driven by the hub, which pushes each endpoint's data
+            # into this coordinator after every refresh.
+            update_interval=None,
+            always_update=False,
+        )
+
+        self.entry_id = config_entry.entry_id
+        self.instance_id = config_entry.data[CONF_INSTANCE_ID]
+        # Resolved by async_load_environments
+        self.environments: list[int] = []
+        self.hub = hub
+        self.api = hub.api
+        self.selector = ContainerSelector.from_options(config_entry.options)
+        self.summary_only = bool(config_entry.options.get(CONF_SUMMARY_ONLY))
+
+        self._unsub_hub = None
+        # Container id -> container and container key -> container, rebuilt
+        # once per refresh so that entity updates are constant time lookups.
+        self._containers: dict[str, PortainerContainer] = {}
+        self._keys: dict[str, ContainerKey] = {}
+        self._by_key: dict[ContainerKey, PortainerContainer] = {}
+        self._fingerprints: dict[ContainerKey, tuple[tuple, str]] = {}
+        # Keys of the containers that changed in the pending update, None to
+        # notify every listener.
+        self._changed: set[ContainerKey] | None = None
+        # Keys of containers that disappeared -> when they were last seen
+        self._missing: dict[ContainerKey, float] = {}
+        # Endpoints of this entry which failed in the last refresh
+        self._failed: set[int] = set()
+        # Containers grouped by compose project, and the stacks with entities
+        self._stacks = StackIndex()
+        self._stack_keys: set[StackKey] = set()
+        self._stacks_version: int | None = None
+        # Endpoint id -> its last snapshot counts, in summary mode
+        self._summaries: dict[int, dict[str, Any] | None] = {}
+        self._last_dispatch_success = True
+        self.dispatch_stats = DispatchStats()
+
+    async def async_load_environments(self) -> None:
+        """Resolve the entry's endpoints, listing them if it follows all."""
+        environments = configured_endpoint_ids(self.config_entry.data)
+
+        if environments is None:
+            environments = self.hub.preloaded_endpoint_ids()
+
+        if environments is None:
+            await self.hub.async_load_cache()
+            environments = self.hub.restored_endpoint_ids()
+
+        if environments is None:
+            environments = [e.id for e in await self.api.load_endpoints_list()]
+
+        self.environments = environments
+
+    async def async_restore(self) -> bool:
+        """Take the entry's data from the hub's restored or current data.
+
+        Returns False if the hub has no data for some of the entry's
+        endpoints, which then need a first refresh.
+        """
+        await self.hub.async_load_cache()
+
+        if not self.hub.data or not self.hub.data.keys() >= set(self.environments):
+            return False
+
+        self.async_set_updated_data(self._endpoint_data())
+
+        return True
+
+    def attach(self) -> None:
+        self.hub.register(self.entry_id, self.environments, self.config_entry.options)
+        self._unsub_hub = self.hub.async_add_listener(self._handle_hub_update)
+
+    def detach(self) -> None:
+        if self._unsub_hub:
+            self._unsub_hub()
+            self._unsub_hub = None
+
+        self.hub.unregister(self.entry_id)
+
+    def _endpoint_data(self) -> dict[int, dict[str, any]] | None:
+        if not self.hub.data:
+            return None
+
+        data = {
+            endpoint_id: self.hub.data[endpoint_id]
+            for endpoint_id in self.environments
+            if endpoint_id in self.hub.data
+        }
+        self._build_index(data)
+        self._changed, active = self._diff_containers()
+
+        # Status texts such as "Up 5 minutes" age on every poll, saving them
+        # would rewrite the store forever.
+        if active:
+            self.hub.note_activity()
+            self.hub.async_schedule_cache_save()
+
+        # Entities of endpoints which started or stopped failing change
+        # availability.
+        failed = self.hub.failed_endpoints.intersection(self.environments)
+        toggled = failed ^ self._failed
+
+        if toggled:
+            self._changed.update(key for key in self._by_key if key[0] in toggled)
+            self._failed = failed
+
+        expired = self._expire_missing()
+        self._changed |= self._update_stacks(expired, toggled)
+        self._changed |= self._update_summaries(data, toggled)
+
+        return data
+
+    def _diff_containers(self) -> tuple[set[ContainerKey], bool]:
+        """Return the containers that changed, and whether any did more than
+        have its status text age, e.g. from "Up 5 minutes" to "Up 6 minutes".
+        """
+        fingerprints = {
+            key: container.fingerprint() for key, container in self._by_key.items()
+        }
+        previous = self._fingerprints
+        self._fingerprints = fingerprints
+
+        changed = {
+            key
+            for key, fingerprint in fingerprints.items()
+            if previous.get(key) != fingerprint
+        }
+        changed.update(previous.keys() - fingerprints.keys())
+        active = any(
+            key not in previous
+            or key not in fingerprints
+            or previous[key][0] != fingerprints[key][0]
+            for key in changed
+        )
+
+        return changed, active
+
+    def _expire_missing(self) -> list[ContainerKey]:
+        """Remove the devices of containers which have been gone for a while.
+
+        A container that disappears only makes its entities unavailable, so
+        that recreating it (e.g. docker compose up) reuses them instead of
+        removing and adding them again. Returns the keys of the containers
+        whose devices were removed.
+        """
+        now = time.monotonic()
+
+        for key in self._missing.keys() & self._by_key.keys():
+            del self._missing[key]
+
+        for key in self._changed - self._by_key.keys():
+            self._missing.setdefault(key, now)
+
+        expired = [
+            key
+            for key, since in self._missing.items()
+            if now - since >= CONTAINER_REMOVAL_DELAY.total_seconds()
+        ]
+
+        for key in expired:
+            del self._missing[key]
+            _LOGGER.debug("Removing device of container %s", key)
+            self._remove_device(self.container_unique_id(key))
+
+        return expired
+
+    def _remove_device(self, identifier: str) -> None:
+        device_registry = dr.async_get(self.hass)
+        device = device_registry.async_get_device(identifiers={(DOMAIN, identifier)})
+
+        if device is not None:
+            device_registry.async_update_device(
+                device.id, remove_config_entry_id=self.entry_id
+            )
+
+    def _update_stacks(
+        self, expired: list[ContainerKey], toggled: set[int]
+    ) -> set[StackKey]:
+        """Regroup the changed containers, returning the stacks that changed.
+
+        Stacks are the compose projects of the entry's containers, present or
+        missing, and the selected stacks Portainer manages on its endpoints.
+        """
+        changed = self._stacks.update(self._by_key, self._changed, expired)
+        grouped = self._stacks.keys()
+        managed = {
+            key
+            for key in self.hub.stacks
+            if key.endpoint_id in self.environments
+            and (self.selector is None or key.project in self.selector.projects)
+        }
+        stack_keys = grouped | managed
+
+        if self._stacks_version != self.hub.stacks_version:
+            self._stacks_version = self.hub.stacks_version
+            changed |= stack_keys
+
+        changed.update(key for key in stack_keys if key.endpoint_id in toggled)
+
+        for key in self._stack_keys - stack_keys:
+            _LOGGER.debug("Removing device of stack %s", key)
+            self._remove_device(self.stack_unique_id(key))
+
+        # Projects deployed since the stacks were listed may be Portainer's.
+        if grouped - self.hub.stacks.keys() - self._stack_keys:
+            self.config_entry.async_create_background_task(
+                self.hass, self.hub.async_refresh_stacks(), f"{DOMAIN} stacks"
+            )
+
+        self._stack_keys = stack_keys
+
+        return changed & stack_keys
+
+    def _update_summaries(
+        self, data: dict[int, dict[str, any]], toggled: set[int]
+    ) -> set[int]:
+        """Return the endpoints whose snapshot counts changed, in summary mode.
+
+        Endpoint ids are the listener context of the summary entities.
+        """
+        if not self.summary_only:
+            return set()
+
+        summaries = {
+            endpoint_id: endpoint.get("Snapshot") or None
+            for endpoint_id, endpoint in data.items()
+        }
+        changed = {
+            endpoint_id
+            for endpoint_id, summary in summaries.items()
+            if self._summaries.get(endpoint_id) != summary
+        }
+        self._summaries = summaries
+
+        if changed:
+            self.hub.async_schedule_cache_save()
+
+        return changed | toggled
+
+    def _build_index(self, data: dict[int, dict[str, any]]) -> None:
+        self._containers = {}
+        self._keys = {}
+        self._by_key = {}
+
+        selector = self.selector
+
+        for endpoint_id, endpoint in data.items():
+            for container in endpoint_containers(endpoint):
+                # Containers of endpoints shared with entries selecting
+                # differently, or handed over by the config flow
+                if selector is not None and not selector.matches(
+                    container.key(), container.labels()
+                ):
+                    continue
+
+                key = (endpoint_id, container.key())
+                self._containers[container.id()] = container
+                self._keys[container.id()] = key
+                self._by_key[key] = container
+
+    @callback
+    def async_update_listeners(self) -> None:
+        """Only notify the entities of containers that changed.
+
+        Entities register with their container id as context. Listeners
+        without a context, and every listener when availability changes, are
+        always notified.
+        """
+        changed = self._changed
+        self._changed = None
+
+        if self.last_update_success != self._last_dispatch_success:
+            changed = None
+
+        self._last_dispatch_success = self.last_update_success
+
+        start = time.perf_counter()
+        notified = 0
+        listeners = list(self._listeners.values())
+
+        for update_callback, context in listeners:
+            if changed is None or context is None or context in changed:
+                update_callback()
+                notified += 1
+
+        stats = self.dispatch_stats
+        stats.updates += 1
+        stats.last_changed = len(changed) if changed is not None else len(listeners)
+        stats.containers_changed += stats.last_changed
+        stats.listeners_notified += notified
+        stats.listeners_skipped += len(listeners) - notified
+        stats.last_duration = (time.perf_counter() - start) * 1000
+        stats.total_duration += stats.last_duration
+
+        _LOGGER.debug(
+            "Notified %d of %d listeners (%d containers changed) in %.2f ms",
+            notified,
+            len(listeners),
+            stats.last_changed,
+            stats.last_duration,
+        )
+
+    @callback
+    def _handle_hub_update(self) -> None:
+        if not self.hub.last_update_success:
+            self.last_update_success = False
+            self._changed = set()
+            self.async_update_listeners()
+            return
+
+        self.async_set_updated_data(self._endpoint_data())
+
+    async def _async_update_data(self):
+        await self.hub.async_refresh()
+
+        if not self.hub.last_update_success:
+            raise UpdateFailed("Error communicating with Portainer API")
+
+        return self._endpoint_data()
+
+    def get_containers(self) -> list[PortainerContainer]:
+        return list(self._containers.values())
+
+    def get_container(self, container_id: str) -> PortainerContainer | None:
+        return self._containers.get(container_id)
+
+    def get_container_by_key(self, key: ContainerKey) -> PortainerContainer | None:
+        return self._by_key.get(key)
+
+    def container_key(self, container: PortainerContainer) -> ContainerKey:
+        return self._keys[container.id()]
+
+    def container_keys(self) -> set[ContainerKey]:
+        """Keys of the containers that have entities, present or not."""
+        return self._by_key.keys() | self._missing.keys()
+
+    def stack_keys(self) -> set[StackKey]:
+        return self._stack_keys
+
+    def stack_record(self, stack: StackKey) -> PortainerStack | None:
+        """Portainer's record of a stack, None if Portainer does not manage it."""
+        return self.hub.stacks.get(stack)
+
+    def stack_counts(self, stack: StackKey) -> tuple[int, int]:
+        """The number of running containers of a stack, and of all of them."""
+        return self._stacks.counts(stack, self._by_key)
+
+    def stack_state(self, stack: StackKey) -> StackState:
+        return StackState.from_counts(*self.stack_counts(stack))
+
+    def stack_unique_id(self, stack: StackKey) -> str:
+        return f"{self.instance_id}-stack-e{stack.endpoint_id}-{stack.project}"
+
+    def stack_key_of(self, unique_id: str) -> StackKey | None:
+        """Parse a stack_unique_id() back into its stack key."""
+        prefix = f"{self.instance_id}-stack-e"
+
+        if not unique_id.startswith(prefix):
+            return None
+
+        endpoint_id, _, project = unique_id.removeprefix(prefix).partition("-")
+
+        if not endpoint_id.isdigit() or not project:
+            return None
+
+        return StackKey(int(endpoint_id), project)
+
+    def endpoint_available(self, endpoint_id: int) -> bool:
+        return endpoint_id not in self._failed
+
+    def endpoint_summary(self, endpoint_id: int) -> dict[str, Any] | None:
+        """The scalar fields of an endpoint's latest Portainer snapshot.
+
+        None for endpoints listed live for another entry, which have none.
+        """
+        return self._summaries.get(endpoint_id)
+
+    def endpoint_name(self, endpoint_id: int) -> str:
+        endpoint = (self.data or {}).get(endpoint_id) or {}
+
+        return endpoint.get("Name") or f"Environment {endpoint_id}"
+
+    def endpoint_unique_id(self, endpoint_id: int) -> str:
+        # The device of single endpoint entries, see container_unique_id().
+        return f"{self.instance_id}-e{endpoint_id}"
+
+    def container_unique_id(self, key: ContainerKey) -> str:
+        # Matches the entry unique id of single endpoint entries, so their
+        # ids are unchanged.
+        endpoint_id, name = key
+
+        return f"{self.instance_id}-e{endpoint_id}-{name}"
+
+    def container_key_of(self, unique_id: str) -> ContainerKey | None:
+        """Parse a container_unique_id() back into its container key.
+
+        The entry's own device is identified by its unique id, which for
+        entries of several endpoints (<instance>-e1-e2) also looks like one.
+        """
+        prefix = f"{self.instance_id}-e"
+
+        if unique_id == self.config_entry.unique_id or not unique_id.startswith(prefix):
+            return None
+
+        endpoint_id, _, name = unique_id.removeprefix(prefix).partition("-")
+
+        if not endpoint_id.isdigit() or not name:
+            return None
+
+        return int(endpoint_id), name
+
+    @callback
+    def async_track_registered_devices(self) -> None:
+        """Pick up the devices of containers which are not listed anymore.
+
+        Containers which went away while Home Assistant was stopped expire
+        like any other missing container. Devices of containers which are no
+        longer selected by name, or of environments the entry no longer
+        follows, are removed right away, as are those of stacks which are
+        gone.
+        """
+        device_registry = dr.async_get(self.hass)
+        now = time.monotonic()
+
+        for device in dr.async_entries_for_config_entry(device_registry, self.entry_id):
+            for domain, identifier in device.identifiers:
+                if domain != DOMAIN:
+                    continue
+
+                if (stack := self.stack_key_of(identifier)) is not None:
+                    if (
+                        stack not in self._stack_keys
+                        and stack.endpoint_id not in self._failed
+                    ):
+                        _LOGGER.debug("Removing device of stack %s", stack)
+                        device_registry.async_update_device(
+                            device.id, remove_config_entry_id=self.entry_id
+                        )
+
+                    continue
+
+                if (key := self.container_key_of(identifier)) is None:
+                    continue
+
+                endpoint_id, name = key
+
+                if key in self._by_key or endpoint_id in self._failed:
+                    continue
+
+                if endpoint_id not in self.environments or (
+                    self.selector is not None and not self.selector.matches_name(name)
+                ):
+                    _LOGGER.debug("Removing device of deselected container %s", key)
+                    device_registry.async_update_device(
+                        device.id, remove_config_entry_id=self.entry_id
+                    )
+                else:
+                    self._missing.setdefault(key, now)
+
+    def _endpoint_of(self, container_id: str) -> int:
+        if container_id not in self._keys:
+            raise HomeAssistantError(f"Container {container_id} no longer exists")
+
+        return self._keys[container_id][0]
+
     async def start_container(self, container_id: str):
-        await self.api.start_container(self.environment, container_id)
+        self.hub.note_activity()
+        await self.api.start_container(self._endpoint_of(container_id), container_id)
 
     async def stop_container(self, container_id: str):
-        await self.api.stop_container(self.environment, container_id)
+        self.hub.note_activity()
+        await self.api.stop_container(self._endpoint_of(container_id), container_id)
+
+    async def restart_container(self, container_id: str):
+        self.hub.note_activity()
+        await self.api.restart_container(self._endpoint_of(container_id), container_id)
+
+    async def pause_container(self, container_id: str):
+        self.hub.note_activity()
+        await self.api.pause_container(self._endpoint_of(container_id), container_id)
+
+    async def unpause_container(self, container_id: str):
+        self.hub.note_activity()
+        await self.api.unpause_container(self._endpoint_of(container_id), container_id)
+
+    async def start_stack(self, stack: StackKey) -> None:
+        """Start a stack, through Portainer if it manages the stack.
+
+        Portainer only starts stacks it considers inactive, the stopped
+        containers of other stacks are started one by one.
+        """
+        self.hub.note_activity()
+        record = self.stack_record(stack)
+
+        if record is not None and not record.active:
+            updated = await self.api.start_stack(record.id, stack.endpoint_id)
+            self.hub.set_stacks({stack: updated or record.with_active(True)})
+        else:
+            await self._async_stack_containers_action(
+                stack,
+                self.api.start_container,
+                [ContainerState.CREATED, ContainerState.EXITED, ContainerState.DEAD],
+            )
+
+        await self._async_sync_stack(stack)
+
+    async def stop_stack(self, stack: StackKey) -> None:
+        self.hub.note_activity()
+        record = self.stack_record(stack)
+
+        if record is not None and record.active:
+            updated = await self.api.stop_stack(record.id, stack.endpoint_id)
+            self.hub.set_stacks({stack: updated or record.with_active(False)})
+        else:
+            await self._async_stack_containers_action(
+                stack,
+                self.api.stop_container,
+                [
+                    ContainerState.RUNNING,
+                    ContainerState.RESTARTING,
+                    ContainerState.PAUSED,
+                ],
+            )
+
+        await self._async_sync_stack(stack)
+
+    async def _async_stack_containers_action(
+        self, stack: StackKey, action, states: list[ContainerState]
+    ) -> None:
+        """Run a container action on the members of a stack in one of states."""
+        semaphore = asyncio.Semaphore(STACK_ACTION_MAX_CONCURRENCY)
+
+        async def run(container: PortainerContainer) -> None:
+            async with semaphore:
+                await action(stack.endpoint_id, container.id())
+
+        containers = [
+            container
+            for key in self._stacks.members(stack)
+            if (container := self._by_key.get(key)) is not None
+            and container.state() in states
+        ]
+        results = await asyncio.gather(
+            *(run(c) for c in containers), return_exceptions=True
+        )
+
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def async_query_containers(
+        self,
+        selector: ContainerSelector | None = None,
+        states: Iterable[ContainerState] = (),
+    ) -> tuple[list[tuple[int, PortainerContainer]], list[int]]:
+        """List the entry's containers live, whether it has entities for them.
+
+        Every endpoint is listed through the docker API, which applies as much
+        of the selection and the states as it can. Returns the containers
+        with their endpoint id, and the endpoints which could not be listed.
+        """
+        filters = selector.docker_filters() if selector is not None else {}
+        states = {s.value for s in states}
+
+        if states:
+            filters["status"] = sorted(states)
+
+        def accept(endpoint_id: int | None, container: dict[str, any]) -> bool:
+            # Docker ORs name filters and cannot express exclusions.
+            if states and container.get("State") not in states:
+                return False
+
+            return selector is None or selector.matches_docker(container)
+
+        semaphore = asyncio.Semaphore(ENDPOINT_MAX_CONCURRENCY)
+
+        async def run(endpoint_id: int) -> list[PortainerContainer]:
+            async with (
+                semaphore,
+                asyncio.timeout(ENDPOINT_FETCH_TIMEOUT.total_seconds()),
+            ):
+                return await self.api.list_containers(endpoint_id, filters, accept)
+
+        results = await asyncio.gather(
+            *(run(e) for e in self.environments), return_exceptions=True
+        )
+        containers = []
+        failed = []
+
+        for endpoint_id, result in zip(self.environments, results):
+            if isinstance(
+                result, (TimeoutError, CannotConnect, InvalidAuth, SSLCertificateError)
+            ):
+                failed.append(endpoint_id)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                containers.extend((endpoint_id, c) for c in result)
+
+        return containers, failed
+
+    async def _async_sync_stack(self, stack: StackKey) -> None:
+        """Apply a stack's new container states with a single listing.
+
+        Starting a stack that was taken down recreates its containers, those
+        are only picked up by a full refresh.
+        """
+        try:
+            containers = await self.api.list_containers(
+                stack.endpoint_id,
+                {"label": [f"{COMPOSE_PROJECT_LABEL}={stack.project}"]},
+            )
+        except (CannotConnect, InvalidAuth, SSLCertificateError):
+            containers = None
+
+        members = {
+            container.id()
+            for key in self._stacks.members(stack)
+            if (container := self._by_key.get(key)) is not None
+        }
+
+        if (
+            containers is None
+            or {c.id() for c in containers} != members
+            or not self.hub.apply_containers(stack.endpoint_id, containers)
+        ):
+            await self.hub.async_request_refresh()
+
+    async def async_sync_containers(self, container_ids: Iterable[str]) -> None:
+        """Apply the new states of containers with one listing per endpoint.
+
+        Used after actions on many containers. Containers which are no longer
+        known, or whose endpoint cannot be listed, are left to a full refresh.
+        """
+        by_endpoint: dict[int, set[str]] = {}
+        unknown = False
+
+        for container_id in container_ids:
+            if container_id in self._keys:
+                endpoint_id = self._keys[container_id][0]
+                by_endpoint.setdefault(endpoint_id, set()).add(container_id)
+            else:
+                unknown = True
+
+        async def sync(endpoint_id: int, ids: set[str]) -> bool:
+            try:
+                containers = await self.api.list_containers(
+                    endpoint_id, {"id": sorted(ids)}
+                )
+            except (CannotConnect, InvalidAuth, SSLCertificateError):
+                return False
+
+            return {c.id() for c in containers} == ids and self.hub.apply_containers(
+                endpoint_id, containers
+            )
+
+        synced = await asyncio.gather(
+            *(sync(endpoint_id, ids) for endpoint_id, ids in by_endpoint.items())
+        )
+
+        if unknown or not all(synced):
+            await self.hub.async_request_refresh()
+
+    async def async_wait_for_state(
+        self, container_id: str, states: list[ContainerState]
+    ) -> bool:
+        """Poll the container until it reaches one of the states.
+
+        Only the container itself is inspected. Once it converges its new state
+        is applied to the hub's data, if it does not converge in time or is no
+        longer known a full refresh is requested instead.
+        """
+        targets = {s.value for s in states}
+        endpoint_id = self._endpoint_of(container_id)
+        deadline = time.monotonic() + CONVERGE_TIMEOUT.total_seconds()
+
+        while True:
+            try:
+                details = await self.api.inspect_container(endpoint_id, container_id)
+            except (CannotConnect, InvalidAuth, SSLCertificateError):
+                break
+
+            state = details["State"]
+
+            if state["Status"] in targets:
+                if self.hub.set_container_state(
+                    endpoint_id,
+                    container_id,
+                    state["Status"],
+                    state.get("ExitCode", 0),
+                ):
+                    return True
+
+                break
+
+            if time.monotonic() >= deadline:
+                _LOGGER.warning(
+                    "Container %s did not reach %s in time",
+                    container_id,
+                    ", ".join(sorted(targets)),
+                )
+                break
+
+            await asyncio.sleep(CONVERGE_POLL_INTERVAL.total_seconds())
+
+        await self.hub.async_request_refresh()
+
+        return False
@@ -0,0 +1,135 @@
+"""Selective decoding of Portainer endpoint payloads.
+
+Endpoint snapshots embed the whole docker state (images, volumes, networks,
+info) while the integration only needs a few fields per container. Payloads
+are reduced to compact endpoints as early as possible:
+
+    {"Id": 1, "Name": "local", "URL": "...", "Snapshot": {...}, "Containers": [...]}
+
+where "Snapshot" holds the scalar fields of the latest snapshot (counts,
+versions, time) and "Containers" the containers built by a factory, by
+default dicts of only CONTAINER_FIELDS. Containers rejected by a filter are
+never built.
+
+Bodies are parsed with Home Assistant's orjson based loader and reduced
+immediately. When ijson is installed stream_compact_endpoints() decodes a
+body incrementally instead, materializing one container at a time. It keeps
+the memory peak far lower but walks every token in Python, several times
+slower than the full parse (see benchmarks/decode.py), so the client does
+not use it.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from typing import Any
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+CONTAINER_FIELDS = ("Id", "Names", "State", "Status", "Image", "Created", "Labels")
+
+_SCALAR_EVENTS = {"string", "number", "boolean", "null"}
+
+# Whether to keep a container, given its endpoint's id (None if not known
+# yet) and the docker container dict
+type ContainerFilter = Callable[[int | None, dict[str, Any]], bool]
+
+
+class MalformedBody(ValueError):
+    """Error to indicate a body is not valid JSON, e.g. because it was cut short."""
+
+
+def compact_container(container: dict[str, Any]) -> dict[str, Any]:
+    return {k: container[k] for k in CONTAINER_FIELDS if k in container}
+
+
+def compact_endpoint(
+    endpoint: dict[str, Any],
+    factory: Callable[[dict[str, Any]], Any] = compact_container,
+    accept: ContainerFilter | None = None,
+) -> dict[str, Any]:
+    snapshots = endpoint.get("Snapshots") or [{}]
+    snapshot = snapshots[0]
+    containers = (snapshot.get("DockerSnapshotRaw") or {}).get("Containers") or []
+
+    return {
+        "Id": endpoint["Id"],
+        "Name": endpoint.get("Name"),
+        "URL": endpoint.get("URL"),
+        "Snapshot": {
+            k: v for k, v in snapshot.items() if not isinstance(v, (dict, list))
+        },
+        "Containers": [
+            factory(c)
+            for c in containers
+            if accept is None or accept(endpoint["Id"], c)
+        ],
+    }
+
+
+async def stream_compact_endpoints(
+    content,
+    array: bool,
+    factory: Callable[[dict[str, Any]], Any] = compact_container,
+    accept: ContainerFilter | None = None,
+) -> list[dict[str, Any]]:
+    """Incrementally decode an endpoint, or a list of them, into compact form.
+
+    content is any object with an async read(n) method, such as an aiohttp
+    StreamReader. Requires ijson. Raises MalformedBody if the body is not
+    valid JSON, e.g. because the connection was cut short.
+    """
+    base = "item." if array else ""
+    root = "item" if array else ""
+    snapshot_prefix = f"{base}Snapshots.item."
+    container_prefix = f"{snapshot_prefix}DockerSnapshotRaw.Containers.item"
+
+    endpoints: list[dict[str, Any]] = []
+    endpoint: dict[str, Any] | None = None
+    builder = None
+
+    try:
+        async for prefix, event, value in ijson.parse(content, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+
+                if prefix == container_prefix and event == "end_map":
+                    container = builder.value
+                    builder = None
+
+                    if accept is None or accept(endpoint["Id"], container):
+                        endpoint["Containers"].append(factory(container))
+
+                continue
+
+            if prefix == container_prefix and event == "start_map":
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            elif prefix == root and event == "start_map":
+                endpoint = {
+                    "Id": None,
+                    "Name": None,
+                    "URL": None,
+                    "Snapshot": {},
+                    "Containers": [],
+                }
+            elif prefix == root and event == "end_map":
+                endpoints.append(endpoint)
+                endpoint = None
+            elif endpoint is None or event not in _SCALAR_EVENTS:
+                continue
+            elif prefix in (f"{base}Id", f"{base}Name", f"{base}URL"):
+                endpoint[prefix.removeprefix(base)] = value
+            elif prefix.startswith(snapshot_prefix):
+                key = prefix.removeprefix(snapshot_prefix)
+
+                # Only the first (latest) snapshot is kept.
+                if "." not in key and key not in endpoint["Snapshot"]:
+                    endpoint["Snapshot"][key] = value
+    except ijson.JSONError as err:
+        raise MalformedBody(str(err)) from err
+
+    return endpoints
@@ -0,0 +1,44 @@
+"""Diagnostics support for the Portainer integration."""
+
+from __future__ import annotations
+
+from dataclasses import asdict
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.const import CONF_API_KEY
+from homeassistant.core import HomeAssistant
+
+from . import PortainerConfigEntry
+
+TO_REDACT = {CONF_API_KEY}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: PortainerConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator = entry.runtime_data.coordinator
+    hub = coordinator.hub
+
+    return {
+        "entry": {
+            "data": async_redact_data(entry.data, TO_REDACT),
+            "options": dict(entry.options),
+        },
+        "hub": {
+            "endpoints": hub.endpoint_ids(),
+            "failed_endpoints": sorted(hub.failed_endpoints),
+            "last_update_success": hub.last_update_success,
+            "update_interval": (
+                hub.update_interval.total_seconds() if hub.update_interval else None
+            ),
+            "circuit": hub.api.circuit.as_dict(),
+        },
+        "environments": coordinator.environments,
+        "containers": len(coordinator.get_containers()),
+        "stacks": len(coordinator.stack_keys()),
+        "managed_stacks": len(hub.stacks),
+        "dispatch": asdict(coordinator.dispatch_stats),
+        "metrics": hub.api.metrics.as_dict(),
+    }
@@ -0,0 +1,110 @@
+"""Request and refresh instrumentation for the Portainer integration."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import re
+from typing import Any
+
+# Upper bounds of the latency histogram buckets in milliseconds, anything
+# slower falls into a final overflow bucket.
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Endpoint and container ids are folded so the number of tracked paths stays
+# bounded, e.g. /api/endpoints/{id}/docker/containers/{id}/json
+_ID_SEGMENT = re.compile(r"/(?:\d+|[0-9a-f]{12,64})(?=/|$)")
+
+
+def normalize_path(path: str) -> str:
+    return _ID_SEGMENT.sub("/{id}", path)
+
+
+class Histogram:
+    """A fixed bucket histogram of durations in milliseconds."""
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if value_ms <= bound:
+                break
+        else:
+            i = len(LATENCY_BUCKETS_MS)
+
+        self.buckets[i] += 1
+        self.count += 1
+        self.total += value_ms
+        self.last = value_ms
+
+    def mean(self) -> float | None:
+        return self.total / self.count if self.count else None
+
+    def as_dict(self) -> dict[str, Any]:
+        labels = [f"<={b}" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+
+        return {
+            "count": self.count,
+            "mean_ms": round(self.mean(), 2) if self.count else None,
+            "last_ms": round(self.last, 2),
+            "buckets": dict(zip(labels, self.buckets)),
+        }
+
+
+@dataclass
+class PortainerMetrics:
+    """Counters kept by a PortainerAPI and its hub."""
+
+    # Normalized path -> request latency
+    requests: dict[str, Histogram] = field(default_factory=dict)
+    errors: dict[str, int] = field(default_factory=dict)
+    bytes_received: int = 0
+    last_latency: float | None = None
+    parse_time: Histogram = field(default_factory=Histogram)
+    tick_duration: Histogram = field(default_factory=Histogram)
+    # Requests and refreshes saved by sharing one which was already running
+    coalesced_requests: int = 0
+    coalesced_refreshes: int = 0
+
+    def record_request(
+        self, path: str, latency: float, size: int, parse_time: float | None = None
+    ) -> None:
+        """Record a successful request, times are in seconds."""
+        key = normalize_path(path)
+
+        if key not in self.requests:
+            self.requests[key] = Histogram()
+
+        self.last_latency = latency * 1000
+        self.requests[key].observe(self.last_latency)
+        self.bytes_received += size
+
+        if parse_time is not None:
+            self.parse_time.observe(parse_time * 1000)
+
+    def record_error(self, path: str) -> None:
+        key = normalize_path(path)
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    def record_tick(self, duration: float) -> None:
+        self.tick_duration.observe(duration * 1000)
+
+    def record_coalesced_request(self) -> None:
+        self.coalesced_requests += 1
+
+    def record_coalesced_refresh(self) -> None:
+        self.coalesced_refreshes += 1
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "requests": {k: v.as_dict() for k, v in self.requests.items()},
+            "errors": dict(self.errors),
+            "bytes_received": self.bytes_received,
+            "parse_time": self.parse_time.as_dict(),
+            "tick_duration": self.tick_duration.as_dict(),
+            "coalesced_requests": self.coalesced_requests,
+            "coalesced_refreshes": self.coalesced_refreshes,
+        }
@@ -0,0 +1,122 @@
+"""Retry, circuit breaking and coalescing helpers for the Portainer API client."""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from functools import partial
+import random
+import time
+
+# Idempotent requests are retried this many times after a connection failure
+GET_RETRIES = 2
+RETRY_BASE_DELAY = 0.5
+
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_RESET_TIMEOUT = 30
+CIRCUIT_MAX_RESET_TIMEOUT = 300
+
+
+def retry_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter around the nominal delay."""
+    return RETRY_BASE_DELAY * 2**attempt * random.uniform(0.5, 1.5)
+
+
+class CircuitBreaker:
+    """Stops requests to a server that keeps failing.
+
+    The circuit opens after CIRCUIT_FAILURE_THRESHOLD consecutive failures.
+    While open requests fail immediately, once the reset timeout has passed a
+    single probe is allowed through (half-open). A successful probe closes
+    the circuit, a failed one reopens it with a doubled timeout.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self) -> None:
+        self.failures = 0
+        self.reset_timeout = CIRCUIT_RESET_TIMEOUT
+        self._opened_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+
+        return self.OPEN
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.reset_timeout = CIRCUIT_RESET_TIMEOUT
+        self._opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+
+        if self._opened_at is not None:
+            # A failed probe, wait longer before the next one.
+            self.reset_timeout = min(self.reset_timeout * 2, CIRCUIT_MAX_RESET_TIMEOUT)
+            self._opened_at = time.monotonic()
+        elif self.failures >= CIRCUIT_FAILURE_THRESHOLD:
+            self._opened_at = time.monotonic()
+
+    def as_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "reset_timeout": self.reset_timeout,
+        }
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Lets concurrent callers with the same key share one call and its result.
+
+    The call runs in a task of its own, so that a caller which is cancelled,
+    e.g. by a timeout, does not cancel it for the others. It is cancelled
+    once every caller is gone. Callers share the result object itself.
+    """
+
+    def __init__(self, on_shared: Callable[[], None] | None = None) -> None:
+        self._on_shared = on_shared
+        self._flights: dict[Hashable, _Flight] = {}
+
+    async def run[T](self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        flight = self._flights.get(key)
+
+        if flight is None:
+            flight = _Flight(asyncio.get_running_loop().create_task(call()))
+            flight.task.add_done_callback(partial(self._done, key, flight))
+            self._flights[key] = flight
+        elif self._on_shared is not None:
+            self._on_shared()
+
+        flight.waiters += 1
+
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+
+    def _done(self, key: Hashable, flight: _Flight, task: asyncio.Task) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+        # Retrieved so that a failure nobody waited for is not reported.
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,201 @@
+"""Selection of the containers a Portainer entry follows."""
+
+from __future__ import annotations
+
+from collections.abc import Iterable, Mapping
+import fnmatch
+import re
+from typing import Any
+
+from .const import (
+    CONF_COMPOSE_PROJECTS,
+    CONF_EXCLUDE_NAMES,
+    CONF_INCLUDE_NAMES,
+    CONF_LABEL_SELECTORS,
+    CONF_SUMMARY_ONLY,
+)
+
+COMPOSE_PROJECT_LABEL = "com.docker.compose.project"
+
+
+def _glob_pattern(globs: Iterable[str]) -> re.Pattern | None:
+    globs = list(globs)
+
+    if not globs:
+        return None
+
+    return re.compile("|".join(fnmatch.translate(g) for g in globs))
+
+
+def _docker_name_class(glob: str, start: int) -> tuple[str, int] | None:
+    """Translate the fnmatch ``[...]`` class at ``start`` to a Go regexp class.
+
+    Returns the class and the index after it, or None if the bracket is not
+    closed, in which case fnmatch matches it literally.
+    """
+    i = start + 1
+    negate = i < len(glob) and glob[i] == "!"
+
+    if negate:
+        i += 1
+
+    # A "]" right after the opening bracket is part of the class.
+    end = glob.find("]", i + 1 if i < len(glob) and glob[i] == "]" else i)
+
+    if end < 0:
+        return None
+
+    # Inside a class fnmatch only gives "-" a meaning, Go also "\", "[", "]"
+    # and a leading "^".
+    members = re.sub(r"([\\\[\]^])", r"\\\1", glob[i:end])
+
+    return ("[^" if negate else "[") + members + "]", end + 1
+
+
+def _docker_name_regex(glob: str) -> str:
+    """Translate a glob to the Go regexp of the docker name filter."""
+    parts = []
+    i = 0
+
+    while i < len(glob):
+        c = glob[i]
+        i += 1
+
+        if c == "*":
+            parts.append(".*")
+        elif c == "?":
+            parts.append(".")
+        elif c == "[" and (bracket := _docker_name_class(glob, i - 1)):
+            part, i = bracket
+            parts.append(part)
+        else:
+            parts.append(re.escape(c))
+
+    # Docker matches against names with their leading slash.
+    return "^/?" + "".join(parts) + "$"
+
+
+class ContainerSelector:
+    """Decides from a container's name and labels whether an entry follows it.
+
+    A container is followed when its name matches one of the include globs,
+    if there are any, and none of the exclude globs, it has every selected
+    label (``key`` or ``key=value``) and, if projects are given, belongs to
+    one of the compose projects.
+    """
+
+    def __init__(
+        self,
+        include_names: Iterable[str] = (),
+        exclude_names: Iterable[str] = (),
+        labels: Iterable[str] = (),
+        projects: Iterable[str] = (),
+    ) -> None:
+        self.include_names = tuple(include_names)
+        self.exclude_names = tuple(exclude_names)
+        self.labels = tuple(label.partition("=")[::2] for label in labels)
+        self.projects = frozenset(projects)
+        self._include = _glob_pattern(self.include_names)
+        self._exclude = _glob_pattern(self.exclude_names)
+
+    @classmethod
+    def from_options(cls, options: Mapping[str, Any]) -> ContainerSelector | None:
+        """Return the selector configured in an entry's options, if any."""
+        if options.get(CONF_SUMMARY_ONLY):
+            return NoContainers()
+
+        selector = cls(
+            options.get(CONF_INCLUDE_NAMES, ()),
+            options.get(CONF_EXCLUDE_NAMES, ()),
+            options.get(CONF_LABEL_SELECTORS, ()),
+            options.get(CONF_COMPOSE_PROJECTS, ()),
+        )
+
+        return selector if selector else None
+
+    def __bool__(self) -> bool:
+        return bool(
+            self.include_names or self.exclude_names or self.labels or self.projects
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ContainerSelector):
+            return NotImplemented
+
+        return self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def _key(self) -> tuple:
+        return (self.include_names, self.exclude_names, self.labels, self.projects)
+
+    def matches_name(self, name: str) -> bool:
+        if self._include is not None and not self._include.match(name):
+            return False
+
+        return self._exclude is None or not self._exclude.match(name)
+
+    def matches(self, name: str, labels: Mapping[str, str]) -> bool:
+        if not self.matches_name(name):
+            return False
+
+        for key, value in self.labels:
+            if key not in labels or (value and labels[key] != value):
+                return False
+
+        return not self.projects or labels.get(COMPOSE_PROJECT_LABEL) in self.projects
+
+    def matches_docker(self, container: Mapping[str, Any]) -> bool:
+        """Match a container dict as returned by the docker API."""
+        names = container.get("Names") or ("",)
+
+        return self.matches(
+            names[0].removeprefix("/"),
+            container.get("Labels") or {},
+        )
+
+    def docker_filters(self) -> dict[str, list[str]]:
+        """The part of the selection the docker daemon can apply itself.
+
+        Docker ORs name filters and ANDs label filters. Exclusions and more
+        than one compose project are left to matches().
+        """
+        filters = {}
+
+        if self.include_names:
+            filters["name"] = [_docker_name_regex(g) for g in self.include_names]
+
+        labels = ["=".join(filter(None, label)) for label in self.labels]
+
+        if len(self.projects) == 1:
+            labels.append(f"{COMPOSE_PROJECT_LABEL}={next(iter(self.projects))}")
+
+        if labels:
+            filters["label"] = labels
+
+        return filters
+
+
+class NoContainers(ContainerSelector):
+    """Selects no container, for entries that only summarize their endpoints.
+
+    The hub then skips every container of endpoints that only such entries
+    follow.
+    """
+
+    def __bool__(self) -> bool:
+        return True
+
+    def _key(self) -> tuple:
+        return (None,)
+
+    def matches_name(self, name: str) -> bool:
+        return False
+
+    def matches(self, name: str, labels: Mapping[str, str]) -> bool:
+        return False
+
+    def docker_filters(self) -> dict[str, list[str]]:
+        # The daemon cannot list nothing, matches() rejects every container.
+        return {}
@@ -1,7 +1,18 @@
 """"""
 
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import Platform
+from homeassistant.const import (
+    PERCENTAGE,
+    EntityCategory,
+    Platform,
+    UnitOfInformation,
+    UnitOfTime,
+)
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.update_coordinator import (
@@ -12,13 +23,216 @@ from homeassistant.helpers.update_coordinator import (
 from . import PortainerConfigEntry
 from .coordinator import PortainerDataCoordinator
 from .const import DOMAIN
-from .base import PortainerBaseEntity
-from homeassistant.components.sensor import SensorDeviceClass, SensorEntity
+from .base import (
+    PortainerBaseEntity,
+    PortainerEndpointEntity,
+    PortainerEndpointSummaryEntity,
+    PortainerStackEntity,
+    async_add_container_entities,
+    async_add_stack_entities,
+)
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorEntityDescription,
+    SensorStateClass,
+)
+from homeassistant.helpers.typing import StateType
+from homeassistant.util import dt as dt_util
 from .api import ContainerState, PortainerContainer
+from .stacks import StackKey, StackState
+from .stats import ContainerStats, ContainerStatsCoordinator
 
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
 
+@dataclass(frozen=True, kw_only=True)
+class PortainerDiagnosticSensorEntityDescription(SensorEntityDescription):
+    value_fn: Callable[[PortainerDataCoordinator], StateType]
+
+
+DIAGNOSTIC_SENSORS: tuple[PortainerDiagnosticSensorEntityDescription, ...] = (
+    PortainerDiagnosticSensorEntityDescription(
+        key="request_latency",
+        name="API request latency",
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        device_class=SensorDeviceClass.DURATION,
+        state_class=SensorStateClass.MEASUREMENT,
+        suggested_display_precision=1,
+        value_fn=lambda c: c.api.metrics.last_latency,
+    ),
+    PortainerDiagnosticSensorEntityDescription(
+        key="bytes_received",
+        name="API bytes received",
+        native_unit_of_measurement=UnitOfInformation.BYTES,
+        device_class=SensorDeviceClass.DATA_SIZE,
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda c: c.api.metrics.bytes_received,
+    ),
+    PortainerDiagnosticSensorEntityDescription(
+        key="coalesced_requests",
+        name="API requests coalesced",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda c: (
+            c.api.metrics.coalesced_requests + c.api.metrics.coalesced_refreshes
+        ),
+    ),
+    PortainerDiagnosticSensorEntityDescription(
+        key="parse_time",
+        name="API parse time",
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        device_class=SensorDeviceClass.DURATION,
+        state_class=SensorStateClass.MEASUREMENT,
+        suggested_display_precision=2,
+        value_fn=lambda c: c.api.metrics.parse_time.last,
+    ),
+    PortainerDiagnosticSensorEntityDescription(
+        key="refresh_duration",
+        name="Refresh duration",
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        device_class=SensorDeviceClass.DURATION,
+        state_class=SensorStateClass.MEASUREMENT,
+        suggested_display_precision=1,
+        value_fn=lambda c: c.api.metrics.tick_duration.last,
+    ),
+    PortainerDiagnosticSensorEntityDescription(
+        key="dispatch_time",
+        name="Entity dispatch time",
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        device_class=SensorDeviceClass.DURATION,
+        state_class=SensorStateClass.MEASUREMENT,
+        suggested_display_precision=2,
+        value_fn=lambda c: c.dispatch_stats.last_duration,
+    ),
+)
+
+
+@dataclass(frozen=True, kw_only=True)
+class PortainerSummarySensorEntityDescription(SensorEntityDescription):
+    value_fn: Callable[[Mapping[str, Any]], StateType | datetime]
+
+
+def _snapshot_time(summary: Mapping[str, Any]) -> datetime | None:
+    if not (time := summary.get("Time")):
+        return None
+
+    return dt_util.utc_from_timestamp(time)
+
+
+# Counts of Portainer's latest snapshot of an endpoint, which it takes every
+# few minutes.
+SUMMARY_SENSORS: tuple[PortainerSummarySensorEntityDescription, ...] = (
+    PortainerSummarySensorEntityDescription(
+        key="running_containers",
+        name="Running containers",
+        icon="mdi:play-circle-outline",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda s: s.get("RunningContainerCount"),
+    ),
+    PortainerSummarySensorEntityDescription(
+        key="stopped_containers",
+        name="Stopped containers",
+        icon="mdi:stop-circle-outline",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda s: s.get("StoppedContainerCount"),
+    ),
+    PortainerSummarySensorEntityDescription(
+        key="healthy_containers",
+        name="Healthy containers",
+        icon="mdi:heart-pulse",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda s: s.get("HealthyContainerCount"),
+    ),
+    PortainerSummarySensorEntityDescription(
+        key="unhealthy_containers",
+        name="Unhealthy containers",
+        icon="mdi:heart-broken",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda s: s.get("UnhealthyContainerCount"),
+    ),
+    PortainerSummarySensorEntityDescription(
+        key="images",
+        name="Images",
+        icon="mdi:package-variant-closed",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda s: s.get("ImageCount"),
+    ),
+    PortainerSummarySensorEntityDescription(
+        key="volumes",
+        name="Volumes",
+        icon="mdi:database",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda s: s.get("VolumeCount"),
+    ),
+    PortainerSummarySensorEntityDescription(
+        key="snapshot_time",
+        name="Last snapshot",
+        device_class=SensorDeviceClass.TIMESTAMP,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        value_fn=_snapshot_time,
+    ),
+)
+
+
+@dataclass(frozen=True, kw_only=True)
+class PortainerStatsSensorEntityDescription(SensorEntityDescription):
+    value_fn: Callable[[ContainerStats], StateType]
+
+
+# Stats are fetched per container, so they are opt-in.
+STATS_SENSORS: tuple[PortainerStatsSensorEntityDescription, ...] = (
+    PortainerStatsSensorEntityDescription(
+        key="cpu_percent",
+        name="CPU usage",
+        native_unit_of_measurement=PERCENTAGE,
+        state_class=SensorStateClass.MEASUREMENT,
+        suggested_display_precision=1,
+        entity_registry_enabled_default=False,
+        value_fn=lambda s: s.cpu_percent,
+    ),
+    PortainerStatsSensorEntityDescription(
+        key="memory_usage",
+        name="Memory usage",
+        native_unit_of_measurement=UnitOfInformation.BYTES,
+        suggested_unit_of_measurement=UnitOfInformation.MEBIBYTES,
+        device_class=SensorDeviceClass.DATA_SIZE,
+        state_class=SensorStateClass.MEASUREMENT,
+        suggested_display_precision=1,
+        entity_registry_enabled_default=False,
+        value_fn=lambda s: s.memory_usage,
+    ),
+    PortainerStatsSensorEntityDescription(
+        key="memory_percent",
+        name="Memory usage percent",
+        native_unit_of_measurement=PERCENTAGE,
+        state_class=SensorStateClass.MEASUREMENT,
+        suggested_display_precision=1,
+        entity_registry_enabled_default=False,
+        value_fn=lambda s: s.memory_percent,
+    ),
+    PortainerStatsSensorEntityDescription(
+        key="network_rx",
+        name="Network received",
+        native_unit_of_measurement=UnitOfInformation.BYTES,
+        suggested_unit_of_measurement=UnitOfInformation.MEBIBYTES,
+        device_class=SensorDeviceClass.DATA_SIZE,
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        entity_registry_enabled_default=False,
+        value_fn=lambda s: s.network_rx,
+    ),
+    PortainerStatsSensorEntityDescription(
+        key="network_tx",
+        name="Network sent",
+        native_unit_of_measurement=UnitOfInformation.BYTES,
+        suggested_unit_of_measurement=UnitOfInformation.MEBIBYTES,
+        device_class=SensorDeviceClass.DATA_SIZE,
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        entity_registry_enabled_default=False,
+        value_fn=lambda s: s.network_tx,
+    ),
+)
+
+
 async def async_setup_entry(
     hass: HomeAssistant,
     entry: PortainerConfigEntry,
@@ -27,12 +241,41 @@ async def async_setup_entry(
     """Setup the sensors for each container"""
 
     coordinator: PortainerDataCoordinator = entry.runtime_data.coordinator
+    stats = entry.runtime_data.stats
+
+    async_add_entities(
+        EndpointDiagnosticSensor(coordinator, description)
+        for description in DIAGNOSTIC_SENSORS
+    )
 
-    sensors = [
-        ContainerStatusSensor(coordinator, c) for c in coordinator.get_containers()
-    ]
+    # Entries in summary mode have no container or stack entities at all.
+    if coordinator.summary_only:
+        async_add_entities(
+            EndpointSummarySensor(coordinator, endpoint_id, description)
+            for endpoint_id in coordinator.environments
+            for description in SUMMARY_SENSORS
+        )
+        return
 
-    async_add_entities(sensors)
+    async_add_container_entities(
+        entry,
+        coordinator,
+        async_add_entities,
+        lambda c: [
+            ContainerStatusSensor(coordinator, c),
+            *(
+                ContainerStatsSensor(coordinator, stats, c, description)
+                for description in STATS_SENSORS
+            ),
+        ],
+    )
+
+    async_add_stack_entities(
+        entry,
+        coordinator,
+        async_add_entities,
+        lambda s: [StackStatusSensor(coordinator, s)],
+    )
 
 
 class ContainerStatusSensor(PortainerBaseEntity, SensorEntity):
@@ -64,3 +307,111 @@ class ContainerStatusSensor(PortainerBaseEntity, SensorEntity):
     def name(self) -> str:
         """Return the name of the container."""
         return "status"
+
+
+class ContainerStatsSensor(PortainerBaseEntity, SensorEntity):
+    entity_description: PortainerStatsSensorEntityDescription
+
+    def __init__(
+        self,
+        coordinator: PortainerDataCoordinator,
+        stats: ContainerStatsCoordinator,
+        container: PortainerContainer,
+        description: PortainerStatsSensorEntityDescription,
+    ):
+        super().__init__(coordinator, container, f"stats-{description.key}")
+        self.stats = stats
+        self.entity_description = description
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+
+        # Registering the container key is what gets it sampled.
+        self.async_on_remove(
+            self.stats.async_add_listener(self.async_write_ha_state, self.container_key)
+        )
+
+        # Sample now rather than after a full interval, the debouncer folds
+        # the requests of every entity added at once into one round.
+        self.coordinator.config_entry.async_create_background_task(
+            self.hass, self.stats.async_request_refresh(), f"{DOMAIN} stats refresh"
+        )
+
+    @property
+    def available(self) -> bool:
+        return super().available and self.stats.last_update_success
+
+    @property
+    def native_value(self) -> StateType:
+        stats = (self.stats.data or {}).get(self.container_key)
+
+        if stats is None:
+            return None
+
+        return self.entity_description.value_fn(stats)
+
+
+class StackStatusSensor(PortainerStackEntity, SensorEntity):
+    _attr_icon = "mdi:layers"
+    _attr_name = "status"
+    _attr_device_class = SensorDeviceClass.ENUM
+    _attr_options = [s.value for s in StackState]
+
+    def __init__(self, coordinator: PortainerDataCoordinator, stack: StackKey):
+        super().__init__(coordinator, stack, "status")
+
+    @property
+    def native_value(self) -> str:
+        return self.coordinator.stack_state(self.stack).value
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any]:
+        running, total = self.coordinator.stack_counts(self.stack)
+        record = self.coordinator.stack_record(self.stack)
+
+        return {
+            "running": running,
+            "containers": total,
+            "stack_id": record.id if record is not None else None,
+        }
+
+
+class EndpointDiagnosticSensor(PortainerEndpointEntity, SensorEntity):
+    entity_description: PortainerDiagnosticSensorEntityDescription
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(
+        self,
+        coordinator: PortainerDataCoordinator,
+        description: PortainerDiagnosticSensorEntityDescription,
+    ):
+        super().__init__(coordinator, description.key)
+        self.entity_description = description
+
+    @property
+    def native_value(self) -> StateType:
+        return self.entity_description.value_fn(self.coordinator)
+
+
+class EndpointSummarySensor(PortainerEndpointSummaryEntity, SensorEntity):
+    entity_description: PortainerSummarySensorEntityDescription
+
+    def __init__(
+        self,
+        coordinator: PortainerDataCoordinator,
+        endpoint_id: int,
+        description: PortainerSummarySensorEntityDescription,
+    ):
+        super().__init__(coordinator, endpoint_id, f"summary-{description.key}")
+        self.entity_description = description
+
+    @property
+    def native_value(self) -> StateType | datetime:
+        summary = self.coordinator.endpoint_summary(self.endpoint_id)
+
+        if summary is None:
+            return None
+
+        return self.entity_description.value_fn(summary)
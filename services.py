@@ -0,0 +1,253 @@
+"""Services for the Portainer integration."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any
+
+import voluptuous as vol
+
+from homeassistant.config_entries import ConfigEntryState
+from homeassistant.const import ATTR_ENTITY_ID
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+)
+from homeassistant.exceptions import HomeAssistantError, ServiceValidationError
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.entity_platform import async_get_platforms
+
+from .api import ContainerState
+from .base import PortainerBaseEntity
+from .const import DOMAIN
+from .coordinator import PortainerDataCoordinator
+from .selection import ContainerSelector
+
+_LOGGER = logging.getLogger(__name__)
+
+SERVICE_BULK_ACTION = "bulk_action"
+SERVICE_GET_CONTAINERS = "get_containers"
+
+ATTR_ACTION = "action"
+ATTR_LABEL = "label"
+ATTR_NAME = "name"
+ATTR_STATE = "state"
+ATTR_CONFIG_ENTRY_ID = "config_entry_id"
+ATTR_MAX_CONCURRENCY = "max_concurrency"
+
+DEFAULT_MAX_CONCURRENCY = 4
+
+# Service action -> coordinator method
+BULK_ACTIONS = {
+    "start": PortainerDataCoordinator.start_container,
+    "stop": PortainerDataCoordinator.stop_container,
+    "restart": PortainerDataCoordinator.restart_container,
+    "pause": PortainerDataCoordinator.pause_container,
+    "unpause": PortainerDataCoordinator.unpause_container,
+}
+
+BULK_ACTION_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            vol.Required(ATTR_ACTION): vol.In(list(BULK_ACTIONS)),
+            vol.Optional(ATTR_ENTITY_ID): cv.entity_ids,
+            vol.Optional(ATTR_LABEL): cv.string,
+            vol.Optional(ATTR_CONFIG_ENTRY_ID): cv.string,
+            vol.Optional(
+                ATTR_MAX_CONCURRENCY, default=DEFAULT_MAX_CONCURRENCY
+            ): vol.All(vol.Coerce(int), vol.Range(min=1, max=32)),
+        }
+    ),
+    cv.has_at_least_one_key(ATTR_ENTITY_ID, ATTR_LABEL),
+)
+
+GET_CONTAINERS_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_CONFIG_ENTRY_ID): cv.string,
+        vol.Optional(ATTR_NAME): vol.All(cv.ensure_list, [cv.string]),
+        vol.Optional(ATTR_LABEL): cv.string,
+        vol.Optional(ATTR_STATE): vol.All(
+            cv.ensure_list, [vol.In([s.value for s in ContainerState])]
+        ),
+    }
+)
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the integration's services."""
+
+    async def async_bulk_action(call: ServiceCall) -> ServiceResponse:
+        targets = _resolve_targets(hass, call.data)
+
+        if not targets:
+            raise ServiceValidationError("No Portainer containers matched the call")
+
+        method = BULK_ACTIONS[call.data[ATTR_ACTION]]
+        semaphore = asyncio.Semaphore(call.data[ATTR_MAX_CONCURRENCY])
+
+        async def run(
+            coordinator: PortainerDataCoordinator, container_id: str
+        ) -> dict[str, Any]:
+            container = coordinator.get_container(container_id)
+            result = {
+                "container_id": container_id,
+                "name": container.stripped_name() if container else None,
+                "success": True,
+            }
+
+            async with semaphore:
+                start = time.monotonic()
+
+                try:
+                    await method(coordinator, container_id)
+                except HomeAssistantError as err:
+                    result["success"] = False
+                    result["error"] = type(err).__name__
+
+                result["duration"] = round(time.monotonic() - start, 3)
+
+            return result
+
+        start = time.monotonic()
+        results = await asyncio.gather(
+            *(run(coordinator, container_id) for coordinator, container_id in targets)
+        )
+
+        # One listing per endpoint rather than a refresh per container. The
+        # records are applied to the hub's data, which keeps them over older
+        # Portainer snapshots.
+        by_coordinator: dict[PortainerDataCoordinator, list[str]] = {}
+
+        for coordinator, container_id in targets:
+            by_coordinator.setdefault(coordinator, []).append(container_id)
+
+        await asyncio.gather(
+            *(
+                coordinator.async_sync_containers(container_ids)
+                for coordinator, container_ids in by_coordinator.items()
+            )
+        )
+
+        _LOGGER.debug(
+            "Bulk %s of %d containers finished in %.2fs",
+            call.data[ATTR_ACTION],
+            len(results),
+            time.monotonic() - start,
+        )
+
+        return {
+            "results": results,
+            "duration": round(time.monotonic() - start, 3),
+        }
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_BULK_ACTION,
+        async_bulk_action,
+        schema=BULK_ACTION_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    async def async_get_containers(call: ServiceCall) -> ServiceResponse:
+        entry = hass.config_entries.async_get_entry(call.data[ATTR_CONFIG_ENTRY_ID])
+
+        if (
+            entry is None
+            or entry.domain != DOMAIN
+            or entry.state is not ConfigEntryState.LOADED
+        ):
+            raise ServiceValidationError("The Portainer entry is not loaded")
+
+        # Listed live, so entries in summary mode can look up containers they
+        # have no entities for.
+        selector = ContainerSelector(
+            include_names=call.data.get(ATTR_NAME, ()),
+            labels=[call.data[ATTR_LABEL]] if ATTR_LABEL in call.data else (),
+        )
+        coordinator: PortainerDataCoordinator = entry.runtime_data.coordinator
+        containers, failed = await coordinator.async_query_containers(
+            selector or None,
+            [ContainerState(state) for state in call.data.get(ATTR_STATE, ())],
+        )
+
+        return {
+            "containers": [
+                {
+                    "endpoint_id": endpoint_id,
+                    "container_id": container.id(),
+                    "name": container.key(),
+                    "state": container.state().value,
+                    "status": container.status(),
+                    "image": container.image(),
+                }
+                for endpoint_id, container in containers
+            ],
+            "failed_endpoints": failed,
+        }
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_CONTAINERS,
+        async_get_containers,
+        schema=GET_CONTAINERS_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+
+
+def _resolve_targets(
+    hass: HomeAssistant, data: dict[str, Any]
+) -> list[tuple[PortainerDataCoordinator, str]]:
+    """Find the containers targeted by entity ids and/or a label selector.
+
+    Containers followed by more than one entry are only targeted once.
+    """
+    # (instance id, endpoint id, container id) -> coordinator
+    targets: dict[tuple[str, int, str], PortainerDataCoordinator] = {}
+
+    if entity_ids := data.get(ATTR_ENTITY_ID):
+        entities = {
+            entity_id: entity
+            for platform in async_get_platforms(hass, DOMAIN)
+            for entity_id, entity in platform.entities.items()
+        }
+
+        for entity_id in entity_ids:
+            entity = entities.get(entity_id)
+
+            if not isinstance(entity, PortainerBaseEntity):
+                raise ServiceValidationError(
+                    f"{entity_id} is not a Portainer container entity"
+                )
+
+            coordinator = entity.coordinator
+            key = (coordinator.hub.instance_id, entity.container_key[0])
+            targets[(*key, entity.container_id)] = coordinator
+
+    if label := data.get(ATTR_LABEL):
+        key, _, value = label.partition("=")
+
+        for entry in hass.config_entries.async_entries(DOMAIN):
+            if entry.state is not ConfigEntryState.LOADED:
+                continue
+
+            if data.get(ATTR_CONFIG_ENTRY_ID) not in (None, entry.entry_id):
+                continue
+
+            coordinator = entry.runtime_data.coordinator
+
+            for container in coordinator.get_containers():
+                labels = container.labels()
+
+                if key in labels and (not value or labels[key] == value):
+                    endpoint_id = coordinator.container_key(container)[0]
+                    instance_id = coordinator.hub.instance_id
+                    targets[(instance_id, endpoint_id, container.id())] = coordinator
+
+    return [
+        (coordinator, container_id)
+        for (_, _, container_id), coordinator in targets.items()
+    ]
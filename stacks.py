@@ -0,0 +1,127 @@
+"""Compose stacks, grouped from the project labels of an entry's containers."""
+
+from __future__ import annotations
+
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from enum import Enum
+
+from .api import ContainerState, PortainerContainer
+from .selection import COMPOSE_PROJECT_LABEL
+
+# Endpoint id and container name, see coordinator.ContainerKey
+type ContainerKey = tuple[int, str]
+
+
+@dataclass(frozen=True, slots=True)
+class StackKey:
+    """Endpoint id and compose project, which identify a stack's entities.
+
+    Unlike container keys this is not a tuple, so that the two never compare
+    equal when used as listener contexts.
+    """
+
+    endpoint_id: int
+    project: str
+
+
+class StackState(Enum):
+    RUNNING = "running"
+    PARTIALLY_RUNNING = "partially_running"
+    STOPPED = "stopped"
+
+    @classmethod
+    def from_counts(cls, running: int, total: int) -> StackState:
+        if running == 0:
+            return cls.STOPPED
+        if running < total:
+            return cls.PARTIALLY_RUNNING
+
+        return cls.RUNNING
+
+
+def stack_of(endpoint_id: int, container: PortainerContainer) -> StackKey | None:
+    project = container.labels().get(COMPOSE_PROJECT_LABEL)
+
+    return StackKey(endpoint_id, project) if project else None
+
+
+class StackIndex:
+    """Containers grouped by compose project.
+
+    The grouping is only updated for the containers that changed in a
+    refresh. Containers that disappeared stay in their stack until they
+    expire, like their entities do.
+    """
+
+    def __init__(self) -> None:
+        self._members: dict[StackKey, set[ContainerKey]] = {}
+        self._stack_of: dict[ContainerKey, StackKey] = {}
+
+    def update(
+        self,
+        containers: Mapping[ContainerKey, PortainerContainer],
+        changed: Iterable[ContainerKey],
+        expired: Iterable[ContainerKey] = (),
+    ) -> set[StackKey]:
+        """Regroup the changed containers and return the stacks they touched."""
+        touched = set()
+
+        for key in changed:
+            previous = self._stack_of.get(key)
+
+            if previous is not None:
+                touched.add(previous)
+
+            if (container := containers.get(key)) is None:
+                continue
+
+            stack = stack_of(key[0], container)
+
+            if stack == previous:
+                continue
+
+            if previous is not None:
+                self._remove(key, previous)
+
+            if stack is not None:
+                self._stack_of[key] = stack
+                self._members.setdefault(stack, set()).add(key)
+                touched.add(stack)
+
+        for key in expired:
+            if (stack := self._stack_of.get(key)) is not None:
+                self._remove(key, stack)
+                touched.add(stack)
+
+        return touched
+
+    def _remove(self, key: ContainerKey, stack: StackKey) -> None:
+        del self._stack_of[key]
+        members = self._members[stack]
+        members.discard(key)
+
+        if not members:
+            del self._members[stack]
+
+    def keys(self) -> set[StackKey]:
+        return set(self._members)
+
+    def members(self, stack: StackKey) -> set[ContainerKey]:
+        return self._members.get(stack, set())
+
+    def counts(
+        self,
+        stack: StackKey,
+        containers: Mapping[ContainerKey, PortainerContainer],
+    ) -> tuple[int, int]:
+        """The number of running containers of a stack, and of all of them."""
+        members = self.members(stack)
+        running = sum(
+            1
+            for key in members
+            if (container := containers.get(key)) is not None
+            and container.state() is ContainerState.RUNNING
+        )
+
+        return running, len(members)
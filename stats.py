@@ -0,0 +1,204 @@
+"""Per container resource usage for the Portainer integration."""
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+import logging
+import time
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+
+from .api import CannotConnect, ContainerState, InvalidAuth, SSLCertificateError
+from .const import STATS_INTERVAL, STATS_MAX_CONCURRENCY, STATS_ROUND_TIMEOUT
+from .coordinator import ContainerKey, PortainerDataCoordinator
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class ContainerStats:
+    cpu_percent: float | None
+    memory_usage: int | None
+    memory_limit: int | None
+    network_rx: int | None
+    network_tx: int | None
+
+    @property
+    def memory_percent(self) -> float | None:
+        if not self.memory_usage or not self.memory_limit:
+            return None
+
+        return self.memory_usage / self.memory_limit * 100
+
+
+def _cpu_counters(sample: dict[str, Any]) -> tuple[int, int]:
+    cpu = sample.get("cpu_stats") or {}
+
+    return (
+        (cpu.get("cpu_usage") or {}).get("total_usage", 0),
+        cpu.get("system_cpu_usage", 0),
+    )
+
+
+def _cpu_percent(
+    sample: dict[str, Any], previous: tuple[int, int] | None
+) -> float | None:
+    """CPU usage between two samples, as docker stats computes it."""
+    if previous is None:
+        return None
+
+    total, system = _cpu_counters(sample)
+    cpu_delta = total - previous[0]
+    system_delta = system - previous[1]
+
+    # Counters reset when the container restarts.
+    if cpu_delta < 0 or system_delta <= 0:
+        return None
+
+    cpu = sample["cpu_stats"]
+    cpus = cpu.get("online_cpus") or len(
+        (cpu.get("cpu_usage") or {}).get("percpu_usage") or ()
+    )
+
+    return cpu_delta / system_delta * (cpus or 1) * 100
+
+
+def _memory_usage(sample: dict[str, Any]) -> int | None:
+    memory = sample.get("memory_stats") or {}
+
+    if "usage" not in memory:
+        return None
+
+    # Like docker stats, page cache which can be reclaimed is not counted.
+    # cgroup v2 reports inactive_file, v1 total_inactive_file.
+    stats = memory.get("stats") or {}
+    cache = stats.get("inactive_file", stats.get("total_inactive_file", 0))
+
+    return memory["usage"] - cache
+
+
+def _network_bytes(sample: dict[str, Any], key: str) -> int | None:
+    # Containers using the host network have no networks of their own.
+    if not (networks := sample.get("networks")):
+        return None
+
+    return sum(n.get(key, 0) for n in networks.values())
+
+
+class ContainerStatsCoordinator(
+    DataUpdateCoordinator[dict[ContainerKey, ContainerStats]]
+):
+    """Samples the resource usage of containers with enabled stats entities.
+
+    Docker only reports stats per container, so only the containers whose
+    keys are registered as listener contexts are sampled, a bounded number
+    at a time. Stats entities are disabled by default, so nothing is
+    fetched until the user enables some.
+
+    A round is limited to STATS_ROUND_TIMEOUT. Containers which were not
+    sampled in time, or failed, keep their previous stats and go first in
+    the next round.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        config_entry: ConfigEntry,
+        coordinator: PortainerDataCoordinator,
+    ) -> None:
+        super().__init__(
+            hass,
+            _LOGGER,
+            config_entry=config_entry,
+            name=f"{config_entry.title} stats",
+            update_interval=STATS_INTERVAL,
+        )
+
+        self.coordinator = coordinator
+        # Container key -> (container id, cpu counters) of the last sample
+        self._cpu_samples: dict[ContainerKey, tuple[str, tuple[int, int]]] = {}
+        # Container key -> when it was last sampled
+        self._sampled_at: dict[ContainerKey, float] = {}
+
+    async def _async_update_data(self) -> dict[ContainerKey, ContainerStats]:
+        containers = [
+            container
+            for key in set(self.async_contexts())
+            if (container := self.coordinator.get_container_by_key(key)) is not None
+            and container.state() is ContainerState.RUNNING
+        ]
+        key_of = self.coordinator.container_key
+        keys = {key_of(c) for c in containers}
+
+        for samples in (self._cpu_samples, self._sampled_at):
+            for key in samples.keys() - keys:
+                del samples[key]
+
+        data = {k: v for k, v in (self.data or {}).items() if k in keys}
+
+        if not containers:
+            return data
+
+        containers.sort(key=lambda c: self._sampled_at.get(key_of(c), 0))
+        semaphore = asyncio.Semaphore(STATS_MAX_CONCURRENCY)
+        sampled = 0
+
+        async def sample(container) -> None:
+            nonlocal sampled
+            key = key_of(container)
+
+            async with semaphore:
+                try:
+                    raw = await self.coordinator.api.container_stats(
+                        key[0], container.id()
+                    )
+                except (CannotConnect, InvalidAuth, SSLCertificateError):
+                    return
+
+            data[key] = self._parse(key, container.id(), raw)
+            self._sampled_at[key] = time.monotonic()
+            sampled += 1
+
+        start = time.monotonic()
+
+        try:
+            async with asyncio.timeout(STATS_ROUND_TIMEOUT.total_seconds()):
+                await asyncio.gather(*(sample(c) for c in containers))
+        except TimeoutError:
+            _LOGGER.debug("Stats round ran out of time")
+
+        _LOGGER.debug(
+            "Sampled %d of %d containers in %.2fs",
+            sampled,
+            len(containers),
+            time.monotonic() - start,
+        )
+
+        if not sampled:
+            raise UpdateFailed("Failed to fetch container stats")
+
+        return data
+
+    def _parse(
+        self, key: ContainerKey, container_id: str, sample: dict[str, Any]
+    ) -> ContainerStats:
+        previous = self._cpu_samples.get(key)
+
+        # A recreated container starts its counters from scratch.
+        if previous is not None and previous[0] != container_id:
+            previous = None
+
+        self._cpu_samples[key] = (container_id, _cpu_counters(sample))
+        memory = sample.get("memory_stats") or {}
+
+        return ContainerStats(
+            cpu_percent=_cpu_percent(sample, previous and previous[1]),
+            memory_usage=_memory_usage(sample),
+            memory_limit=memory.get("limit"),
+            network_rx=_network_bytes(sample, "rx_bytes"),
+            network_tx=_network_bytes(sample, "tx_bytes"),
+        )
@@ -12,13 +12,18 @@ from homeassistant.helpers.update_coordinator import (
 from . import PortainerConfigEntry
 from .coordinator import PortainerDataCoordinator
 from .const import DOMAIN
-from .base import PortainerBaseEntity
+from .base import (
+    PortainerBaseEntity,
+    PortainerStackEntity,
+    async_add_container_entities,
+    async_add_stack_entities,
+)
 from homeassistant.components.switch import SwitchDeviceClass, SwitchEntity
 from .api import ContainerState, PortainerContainer
+from .stacks import StackKey, StackState
 
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 import logging
-import asyncio
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -32,11 +37,22 @@ async def async_setup_entry(
 
     coordinator: PortainerDataCoordinator = entry.runtime_data.coordinator
 
-    switches = [
-        ContainerRunningSwitch(coordinator, c) for c in coordinator.get_containers()
-    ]
+    if coordinator.summary_only:
+        return
+
+    async_add_container_entities(
+        entry,
+        coordinator,
+        async_add_entities,
+        lambda c: [ContainerRunningSwitch(coordinator, c)],
+    )
 
-    async_add_entities(switches)
+    async_add_stack_entities(
+        entry,
+        coordinator,
+        async_add_entities,
+        lambda s: [StackRunningSwitch(coordinator, s)],
+    )
 
 
 class ContainerRunningSwitch(PortainerBaseEntity, SwitchEntity):
@@ -68,19 +84,44 @@ class ContainerRunningSwitch(PortainerBaseEntity, SwitchEntity):
 
         await self.coordinator.start_container(self.container_id)
 
-        await asyncio.sleep(5)
-
-        await self.coordinator.async_refresh()
+        await self.coordinator.async_wait_for_state(
+            self.container_id, [ContainerState.RUNNING]
+        )
 
     async def async_turn_off(self):
         _LOGGER.info("Turning off container %s", self.container.stripped_name())
 
         await self.coordinator.stop_container(self.container_id)
 
-        await asyncio.sleep(5)
-
-        await self.coordinator.async_refresh()
+        await self.coordinator.async_wait_for_state(
+            self.container_id, [ContainerState.EXITED, ContainerState.DEAD]
+        )
 
     @property
     def device_class(self) -> SwitchDeviceClass:
         return SwitchDeviceClass.SWITCH
+
+
+class StackRunningSwitch(PortainerStackEntity, SwitchEntity):
+    """Starts and stops a whole stack, through Portainer where possible."""
+
+    _attr_icon = "mdi:layers"
+    _attr_name = "start"
+    _attr_device_class = SwitchDeviceClass.SWITCH
+
+    def __init__(self, coordinator: PortainerDataCoordinator, stack: StackKey):
+        super().__init__(coordinator, stack, "running-switch")
+
+    @property
+    def is_on(self) -> bool:
+        return self.coordinator.stack_state(self.stack) is not StackState.STOPPED
+
+    async def async_turn_on(self):
+        _LOGGER.info("Starting stack %s", self.stack.project)
+
+        await self.coordinator.start_stack(self.stack)
+
+    async def async_turn_off(self):
+        _LOGGER.info("Stopping stack %s", self.stack.project)
+
+        await self.coordinator.stop_stack(self.stack)